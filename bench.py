@@ -0,0 +1,183 @@
+import argparse
+import io
+import os
+import random
+import struct
+import tempfile
+import time
+import tracemalloc
+import zlib
+from docx import Document
+import dataset
+import ledger
+import report
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+# Number of add_swarm and edit_swarm calls timed per size
+WRITE_CALLS = 100
+# Swarms generate_ledger adds per add_swarms call
+GENERATE_BATCH = 10_000
+
+
+def _metric(rng, scale):
+    """A random metric cell in one of the formats found in real ledgers: "950", "1,234", "12.3k", "2m", "1b" """
+    value = rng.lognormvariate(scale, 2.0)
+    style = rng.random()
+    if value >= 1_000_000_000 and style < 0.5:
+        return f"{value / 1_000_000_000:.0f}b"
+    if value >= 1_000_000 and style < 0.5:
+        return f"{value / 1_000_000:.1f}m"
+    if value >= 1_000 and style < 0.5:
+        return f"{value / 1_000:.1f}k"
+    if value >= 1_000 and style < 0.75:
+        return f"{value:,.0f}"
+    return f"{value:.0f}"
+
+
+def generate_ledger(filename, rows, weeks=12, max_comments=5, seed=0):
+    """Write a synthetic swarm ledger of `rows` swarms spread over `weeks` weeks.
+
+    Each swarm gets 0 to max_comments comments and k/m/b-formatted metrics whose
+    ending values are at least the initial ones. The swarms are added with
+    ledger.add_swarms, GENERATE_BATCH at a time, as an import would add them.
+    """
+    rng = random.Random(seed)
+    ledger.create_csv(filename)
+    for start in range(0, rows, GENERATE_BATCH):
+        swarms = []
+        for number in range(start, min(start + GENERATE_BATCH, rows)):
+            week = number % weeks + 1
+            swarm_number = number // weeks + 1
+            initial = [_metric(rng, scale) for scale in (7, 3, 2, 4, 2)]
+            ending = [_metric(rng, scale + 0.5) for scale in (7, 3, 2, 4, 2)]
+            comments = "\n".join(f"Comment {i} on swarm {swarm_number}" for i in range(rng.randint(0, max_comments)))
+            values = [str(week), str(swarm_number), f"https://x.com/beetrack/status/{number}", f"Tweet {number}",
+                      f"image_{number}.png", *initial, comments, *ending]
+            swarms.append(dict(zip(ledger.SWARM_FIELDS, values)))
+        ledger.add_swarms(filename, swarms)
+
+
+def write_placeholder_logo(filename):
+    """Write a small grey PNG to stand in for the report logo, which is not shipped with the code"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    width, height = 64, 32
+    pixels = b"".join(b"\x00" + b"\x80" * width for _ in range(height))  # Filter byte, then 8-bit grey samples
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+                + chunk(b"IDAT", zlib.compress(pixels)) + chunk(b"IEND", b""))
+
+
+def _swarm_data(week, number):
+    return {"sw_week": week, "sw_number": number, "sw_url": "https://x.com/beetrack/status/0",
+            "tweet_content": "Benchmark tweet", "tweet_image_name": "", "views": "12.3k", "retweets": "45",
+            "quotes": "6", "likes": "1,234", "bookmarks": "7", "comments": "First\nSecond",
+            "ending_views": "2m", "ending_retweets": "50", "ending_quotes": "8", "ending_likes": "1.5k",
+            "ending_bookmarks": "9"}
+
+
+def measure(function, trace_memory=True):
+    """Run function once; returns (seconds, peak traced bytes or None)"""
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return elapsed, peak
+
+
+def _reset_caches(filename):
+    """Forget every in-memory copy of the ledger, as a fresh process would"""
+    dataset.invalidate(filename)
+    ledger.forget(filename)
+
+
+def benchmark(rows, directory, weeks=12, max_comments=5, trace_memory=True, stages=None):
+    """Time each stage on a fresh synthetic ledger of `rows` swarms; returns a list of (stage, seconds, peak bytes)"""
+    filename = os.path.join(directory, f"bench_{rows}.csv")
+    logo_file = os.path.join(directory, "logo.png")
+    results = []
+    state = {}
+
+    def run(stage, function, required=False):
+        # Stages left out with --stage still run, untimed, when a later stage needs their result
+        if stages is None or stage in stages:
+            results.append((stage,) + measure(function, trace_memory))
+        elif required:
+            function()
+
+    def first_week_document():
+        # The per-swarm tables of the first week, as generate_report adds them before saving
+        document = Document(io.BytesIO(report.build_skeleton(logo_file)))
+        week = state["report_data"]["weeks"][0]
+        for _, row, initial, ending, change, comment_list in report.iter_swarms(state["report_data"], week):
+            report.tables_and_comments(document, initial, ending, change, comment_list)
+        return document
+
+    write_placeholder_logo(logo_file)
+    run("generate", lambda: generate_ledger(filename, rows, weeks, max_comments), required=True)
+    _reset_caches(filename)
+    # The first load parses the CSV and writes the snapshot the next one memory-maps
+    run("load_data (cold)", lambda: dataset.load_data(filename), required=True)
+    _reset_caches(filename)
+    run("load_data (snapshot)", lambda: dataset.load_data(filename))
+    run("load_data (cached)", lambda: dataset.load_data(filename))
+    run("weekly_totals", lambda: dataset.weekly_totals(dataset.load_data(filename)))
+    run(f"add_swarm x{WRITE_CALLS}",
+        lambda: [ledger.add_swarm(filename, _swarm_data(weeks + 1, number)) for number in range(WRITE_CALLS)])
+    run(f"edit_swarm x{WRITE_CALLS}",
+        lambda: [ledger.edit_swarm(filename, f"SW-1-{number + 1}", 6, "99k") for number in range(WRITE_CALLS)])
+    _reset_caches(filename)
+    run("report aggregations", lambda: state.update(report_data=report.load_report_data(filename)), required=True)
+    run("add_bar_graph", lambda: report.add_bar_graph(
+        Document(), dict(zip(state["report_data"]["weeks"], state["report_data"]["totals"]["swarms"])),
+        "Total Swarms per Week", "Week", "Number of Swarms", "darkorange"))
+    run("tables_and_comments (week 1)", lambda: state.update(document=first_week_document()),
+        required=stages is not None and "document.save" in stages)
+    run("document.save", lambda: state["document"].save(io.BytesIO()))
+    run("streamed report (all weeks)", lambda: report.generate_report(
+        report.load_report_data(filename, keep_rows=False), "all", True,
+        os.path.join(directory, f"bench_{rows}.docx"), chart_workers=1, stream=True, logo_file=logo_file))
+    return results
+
+
+def format_results(rows, results):
+    lines = [f"{rows:,} rows"]
+    for stage, seconds, peak in results:
+        memory = "" if peak is None else f"{peak / 1_048_576:10.1f} MiB peak"
+        lines.append(f"  {stage:<30}{seconds * 1000:12.1f} ms{memory}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the ledger, dashboard data and report stages on synthetic ledgers.")
+    parser.add_argument("-n", "--rows", type=int, nargs="+", default=DEFAULT_SIZES, help="ledger sizes to benchmark")
+    parser.add_argument("--weeks", type=int, default=12, help="weeks the swarms are spread over")
+    parser.add_argument("--max-comments", type=int, default=5, help="most comments per swarm")
+    parser.add_argument("--stage", action="append", dest="stages", help="only run this stage (repeatable)")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc, which slows the timed code down, and report times only")
+    parser.add_argument("-o", "--output", help="also append the results to this file, e.g. bench_output.txt")
+    parser.add_argument("--keep", metavar="DIR", help="write the synthetic ledgers and reports to DIR and keep them")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = args.keep or temp_dir
+        os.makedirs(directory, exist_ok=True)
+        for rows in args.rows:
+            results = benchmark(rows, directory, args.weeks, args.max_comments, not args.no_memory, args.stages)
+            text = format_results(rows, results)
+            print(text, flush=True)
+            if args.output:
+                with open(args.output, "a", encoding="utf-8") as out:
+                    out.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import io
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Output settings for report charts: "draft" renders quickly, "print" matches the original 300 dpi PNGs
+PRESETS = {
+    "draft": {"dpi": 100, "format": "png"},
+    "print": {"dpi": 300, "format": "png"},
+}
+
+# One figure with an Agg canvas, cleared and redrawn for every chart instead of going through pyplot
+_figure = None
+# Process pool shared by every render_charts call in this process, and its size; each worker
+# imports matplotlib once, not once per report
+_pool = None
+_pool_workers = 0
+
+# Dashboard chart name -> (data version, PNG bytes); only the latest version of each chart is kept
+_chart_cache = {}
+_chart_lock = threading.Lock()
+
+
+def _new_figure(**kwargs):
+    """Figure with an Agg canvas; matplotlib is only imported once a chart is drawn"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _get_figure():
+    global _figure
+    if _figure is None:
+        _figure = _new_figure()
+    return _figure
+
+
+def render_bar_chart(data, title, xlabel, ylabel, color, preset="print"):
+    """Render a bar chart of data (label -> value) and return the encoded image bytes"""
+    import matplotlib.ticker as ticker
+    from metrics import format_number
+
+    settings = PRESETS[preset]
+    fig = _get_figure()
+    fig.clear()
+    ax = fig.add_subplot()
+    ax.bar(list(data.keys()), list(data.values()), color=color)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+
+    # Format y-axis labels
+    ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda x, _: format_number(x)))
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=settings["format"], dpi=settings["dpi"], bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def _render_spec(spec, preset):
+    return render_bar_chart(preset=preset, **spec)
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def render_charts(specs, preset="print", workers=1):
+    """Render a list of render_bar_chart keyword dicts and return the images in the same order.
+
+    With workers > 1 the charts are spread over a process pool that is kept for
+    later calls (each worker reuses its own figure); otherwise they are rendered
+    serially in this process.
+    """
+    if min(workers, len(specs)) <= 1:
+        return [_render_spec(spec, preset) for spec in specs]
+    return list(_get_pool(workers).map(_render_spec, specs, [preset] * len(specs)))
+
+
+def cached_chart(name, version, draw, figsize=(10, 6), dpi=100):
+    """PNG bytes of a dashboard chart, drawn by draw(ax) only when version differs from the cached one.
+
+    The figure is not registered with pyplot and is dropped once encoded, so
+    repeated reruns do not accumulate figures.
+    """
+    with _chart_lock:
+        cached = _chart_cache.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    fig = _new_figure(figsize=figsize)
+    draw(fig.add_subplot())
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    image = buffer.getvalue()
+    with _chart_lock:
+        _chart_cache[name] = (version, image)
+    return image
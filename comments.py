@@ -0,0 +1,64 @@
+import re
+
+# Positions of the columns the store reads in ledger.HEADER
+SWARM_ID = 0
+SWARM_WEEK = 1
+COMMENTS = 11
+
+# Comments are separated by real newlines, but older rows hold a literal "\n" instead
+_SEPARATOR = re.compile(r"\r\n|\r|\n|\\n")
+
+
+def split_comments(text):
+    """Split a Comments cell into its individual comments, dropping blank ones"""
+    if not isinstance(text, str):
+        return []
+    return [comment.strip() for comment in _SEPARATOR.split(text) if comment.strip()]
+
+
+def build_store(rows):
+    """Tokenize the Comments column of ledger rows once into a comment store.
+
+    The store maps each row number to [swarm ID, week, comments] and keeps the
+    total comment count, so counts and listings need no re-splitting.
+    """
+    store = {"rows": {}, "ids": {}, "total": 0}
+    for row_number, row in enumerate(rows):
+        add_row(store, row_number, row)
+    return store
+
+
+def add_row(store, row_number, row):
+    comments = split_comments(row[COMMENTS])
+    store["rows"][row_number] = [row[SWARM_ID], row[SWARM_WEEK], comments]
+    store["ids"].setdefault(row[SWARM_ID], row_number)
+    store["total"] += len(comments)
+
+
+def edit_row(store, row_number, column, value):
+    """Apply an edit_swarm change to the store; only the ID, week and Comments columns matter"""
+    entry = store["rows"][row_number]
+    swarm_id, _, comments = entry
+    if column == SWARM_ID:
+        if store["ids"].get(swarm_id) == row_number:
+            del store["ids"][swarm_id]
+        store["ids"].setdefault(value, row_number)
+        entry[0] = value
+    elif column == SWARM_WEEK:
+        entry[1] = value
+    elif column == COMMENTS:
+        new_comments = split_comments(value)
+        store["total"] += len(new_comments) - len(comments)
+        entry[2] = new_comments
+
+
+def swarm_comments(store, swarm_id):
+    """The comments of a swarm, or an empty list for an unknown Swarm ID"""
+    row_number = store["ids"].get(swarm_id)
+    return [] if row_number is None else store["rows"][row_number][2]
+
+
+def row_comments(store, row_number):
+    """The comments of the row at row_number, in ledger order"""
+    return store["rows"][row_number][2]
+
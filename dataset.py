@@ -0,0 +1,168 @@
+import hashlib
+import io
+import os
+import threading
+import pandas as pd
+import rollup
+import snapshot
+from ledger import HEADER, JOURNAL_SUFFIX, open_csv, position
+from metrics import METRICS, aggregate, parse_metrics
+
+NUMERICAL_COLS = ["Views", "Retweets", "Quotes", "Likes", "Bookmarks",
+                  "Ending Views", "Ending Retweets", "Ending Quotes", "Ending Likes", "Ending Bookmarks"]
+
+# filename -> {"generation", "csv_size", "csv_mtime", "journal_size", "df", "totals"}; shared by every Streamlit session
+_cache = {}
+_lock = threading.Lock()
+
+
+def _signature(filename):
+    stat = os.stat(filename)
+    try:
+        journal_size = os.path.getsize(filename + JOURNAL_SUFFIX)
+    except FileNotFoundError:
+        journal_size = 0
+    return stat.st_size, stat.st_mtime_ns, journal_size
+
+
+def _parse(source, **kwargs):
+    df = pd.read_csv(source, on_bad_lines='skip', **kwargs)
+    # Convert columns to appropriate data types, understanding "1,234" and "12.3k" style values
+    for col in NUMERICAL_COLS:
+        df[col] = parse_metrics(df[col].to_numpy())[0]
+    return df
+
+
+def _frame(table):
+    """DataFrame of a snapshot table, typed the way read_csv types the CSV"""
+    df = table.to_pandas()
+    for col in df.columns:
+        if col not in NUMERICAL_COLS:
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
+def _read_from(filename, offset):
+    """Parse the file from byte offset up to its last complete line; offset 0 includes the header"""
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    data = data[:data.rfind(b"\n") + 1]
+    if offset and not data.strip():
+        return None, offset
+    kwargs = {"header": None, "names": HEADER} if offset else {}
+    return _parse(io.BytesIO(data), **kwargs), offset + len(data)
+
+
+def load_data(filename):
+    """Return the parsed, typed ledger DataFrame, reusing the cached copy while the file is unchanged.
+
+    Rows appended since the last call are parsed on their own and added to the
+    cached frame, as long as the ledger's generation (see ledger.position) is
+    unchanged; any other change (edits, compaction, a rewritten file) reloads it
+    from the columnar snapshot, or from the CSV when the snapshot cannot be used.
+    The returned frame is shared, so callers must copy before modifying it.
+    """
+    try:
+        csv_size, csv_mtime, journal_size = _signature(filename)
+    except FileNotFoundError:
+        return None
+
+    with _lock:
+        entry = _cache.get(filename)
+        if entry is not None and entry["journal_size"] == journal_size:
+            if entry["csv_size"] == csv_size and entry["csv_mtime"] == csv_mtime:
+                return entry["df"]
+            if entry["csv_size"] < csv_size and position(filename)[0] == entry["generation"]:
+                tail, parsed_size = _read_from(filename, entry["csv_size"])
+                if tail is not None:
+                    entry["df"] = pd.concat([entry["df"], tail], ignore_index=True)
+                    entry["totals"] = None
+                entry["csv_size"] = parsed_size
+                entry["csv_mtime"] = csv_mtime if parsed_size == csv_size else None
+                return entry["df"]
+
+        generation = position(filename)[0]
+        loaded = snapshot.load(filename)
+        if loaded is not None:
+            table, snapshot_size, journal_size = loaded
+            df = _frame(table)
+            if snapshot_size != csv_size:
+                csv_size, csv_mtime = snapshot_size, None
+        elif journal_size:
+            with open_csv(filename) as csvfile:
+                df = _parse(csvfile)
+        else:
+            df, parsed_size = _read_from(filename, 0)
+            if parsed_size != csv_size:
+                csv_size, csv_mtime = parsed_size, None
+        _cache[filename] = {"generation": generation, "csv_size": csv_size, "csv_mtime": csv_mtime,
+                            "journal_size": journal_size, "df": df}
+        return df
+
+
+def invalidate(filename):
+    """Drop the cached frame for filename, e.g. after edit_swarm"""
+    with _lock:
+        _cache.pop(filename, None)
+
+
+def weekly_totals(df):
+    """Per-week and overall figures for a dashboard frame (see metrics.aggregate), or None without data.
+
+    The result also holds a "version" hash of the per-week figures. The result for
+    the cached frame is computed once and reused until the frame changes.
+    """
+    if df is None or df.empty:
+        return None
+    with _lock:
+        for entry in _cache.values():
+            if entry["df"] is df and entry.get("totals") is not None:
+                return entry["totals"]
+
+    rows = df[df["Swarm Week"].notna()]
+    totals = aggregate(rows["Swarm Week"].to_numpy(),
+                       {key: rows[key].to_numpy(dtype=float) for key in METRICS},
+                       {key: rows[f"Ending {key}"].to_numpy(dtype=float) for key in METRICS})
+    totals["version"] = totals_version(totals)
+    with _lock:
+        for entry in _cache.values():
+            if entry["df"] is df:
+                entry["totals"] = totals
+    return totals
+
+
+def ledger_totals(filename):
+    """Per-week and overall figures for the dashboard charts, from the ledger's incremental rollup.
+
+    Unlike weekly_totals, only the weeks changed since the last call are re-aggregated.
+    """
+    totals = rollup.weekly_totals(filename, natural_order=True, include_blank=False)
+    totals["version"] = totals_version(totals)
+    return totals
+
+
+def totals_version(totals):
+    """Hash of the per-week figures, so caches built from them change only when they do"""
+    digest = hashlib.sha1(repr(totals["weeks"]).encode())
+    for name in ("swarms", "comments", "initial_total", "ending_total"):
+        digest.update(totals[name].tobytes())
+    for name in ("initial", "ending"):
+        for values in totals[name].values():
+            digest.update(values.tobytes())
+    return digest.hexdigest()
+
+
+def filter_swarms(df, week=None, swarm_id="", comment_text=""):
+    """Rows of df in week whose Swarm ID and Comments contain the given text (case-insensitive)"""
+    mask = pd.Series(True, index=df.index)
+    if week is not None:
+        mask &= df["Swarm Week"] == week
+    if swarm_id:
+        mask &= df["Swarm ID"].astype(str).str.contains(swarm_id, case=False, regex=False)
+    if comment_text:
+        mask &= df["Comments"].fillna("").astype(str).str.contains(comment_text, case=False, regex=False)
+    return df[mask]
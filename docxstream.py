@@ -0,0 +1,94 @@
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+DOCUMENT_PART = "word/document.xml"
+
+# Characters XML 1.0 does not allow; python-docx refuses them too
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _text(text):
+    return escape(_INVALID_XML.sub("", str(text)))
+
+
+def run_xml(text, line_break=False):
+    return f'<w:r><w:t xml:space="preserve">{_text(text)}</w:t>{"<w:br/>" if line_break else ""}</w:r>'
+
+
+def paragraph_xml(text="", style=None):
+    """A paragraph like document.add_paragraph(text, style); "\\n" becomes a line break as in python-docx"""
+    properties = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    content = "<w:br/>".join(f'<w:t xml:space="preserve">{_text(part)}</w:t>' if part else ""
+                             for part in str(text).split("\n"))
+    run = f"<w:r>{content}</w:r>" if content else ""
+    return f"<w:p>{properties}{run}</w:p>"
+
+
+def heading_xml(text, level=1):
+    return paragraph_xml(text, f"Heading{level}")
+
+
+def lines_xml(lines):
+    """One paragraph holding each line followed by a line break, like add_run(f"{line}\\n") per line"""
+    return "<w:p>" + "".join(run_xml(line, line_break=True) for line in lines) + "</w:p>"
+
+
+def page_break_xml():
+    return '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+
+def table_xml(rows, width, style="TableGrid"):
+    """A table of text cells spanning width twips with equal columns, like document.add_table with a style"""
+    columns = max(len(row) for row in rows)
+    column_width = width // columns
+    grid = f'<w:gridCol w:w="{column_width}"/>' * columns
+    cell_start = f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{column_width}"/></w:tcPr><w:p>'
+    body = "".join(
+        "<w:tr>" + "".join(cell_start + (run_xml(cell) if cell else "") + "</w:p></w:tc>" for cell in row) + "</w:tr>"
+        for row in rows
+    )
+    return (f'<w:tbl><w:tblPr><w:tblStyle w:val="{style}"/><w:tblW w:type="auto" w:w="0"/>'
+            f'<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" w:noHBand="0" w:noVBand="1" w:val="04A0"/>'
+            f'</w:tblPr><w:tblGrid>{grid}</w:tblGrid>{body}</w:tbl>')
+
+
+class DocxStreamWriter:
+    """Append body XML to a copy of a saved .docx without holding the document in memory.
+
+    Every part of `template` (bytes of a saved .docx) is copied to `out` as is, except
+    the main document part, which is written up to the body's final section
+    properties; each write() then streams XML straight into the compressed part, and
+    close() adds the closing section properties. Styles used by the written XML must
+    exist in the template.
+    """
+
+    def __init__(self, template, out):
+        self._zip = zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED)
+        with zipfile.ZipFile(io.BytesIO(template)) as source:
+            document_xml = source.read(DOCUMENT_PART).decode("utf-8")
+            for item in source.infolist():
+                if item.filename != DOCUMENT_PART:
+                    self._zip.writestr(item, source.read(item))
+        cut = document_xml.rindex("<w:sectPr")
+        self._suffix = document_xml[cut:].encode("utf-8")
+        self._part = self._zip.open(DOCUMENT_PART, "w")
+        self._part.write(document_xml[:cut].encode("utf-8"))
+
+    def write(self, xml):
+        self._part.write(xml.encode("utf-8"))
+
+    def close(self):
+        if self._part is None:
+            return
+        self._part.write(self._suffix)
+        self._part.close()
+        self._part = None
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import os
+from comments import split_comments
+from ledger import HEADER, SWARM_FIELDS, add_swarms
+from metrics import parse_metrics
+
+# Ledger column name -> add_swarm key, so exported ledgers can be imported as they are
+_COLUMN_FIELDS = dict(zip(HEADER[1:], SWARM_FIELDS))
+_FIELD_COLUMNS = dict(zip(SWARM_FIELDS, HEADER[1:]))
+_METRIC_FIELDS = ["views", "retweets", "quotes", "likes", "bookmarks",
+                  "ending_views", "ending_retweets", "ending_quotes", "ending_likes", "ending_bookmarks"]
+
+
+def _swarm_data(record):
+    """Map a record keyed by add_swarm keys or ledger column names to add_swarm keys"""
+    swarm_data = {field: "" for field in SWARM_FIELDS}
+    for key, value in record.items():
+        field = _COLUMN_FIELDS.get(key, key)
+        if field in swarm_data:
+            swarm_data[field] = "" if value is None else str(value).strip()
+    return swarm_data
+
+
+def read_swarms(source, fmt=None):
+    """Read swarm records from a CSV or JSON file, a path or a file object.
+
+    fmt is "csv" or "json"; by default it is taken from the file name. JSON holds
+    a list of objects. Keys may be add_swarm keys or ledger column names.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return read_swarms(f, fmt or os.path.splitext(source)[1].lstrip("."))
+    if fmt is None:
+        fmt = os.path.splitext(getattr(source, "name", ""))[1].lstrip(".")
+    text = source.read()
+    if isinstance(text, bytes):
+        text = text.decode("utf-8-sig")
+
+    if fmt.lower() == "json":
+        records = json.loads(text)
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValueError("A JSON import must be a list of swarm objects.")
+    elif fmt.lower() == "csv":
+        records = list(csv.DictReader(io.StringIO(text, newline='')))
+    else:
+        raise ValueError(f"Unsupported import format: {fmt!r}")
+    return [_swarm_data(record) for record in records]
+
+
+def validate_swarms(swarms):
+    """Check a batch of swarms, parsing each metric column in one call.
+
+    Returns the valid swarms, with comments normalized to one per line, and a
+    message for each rejected swarm.
+    """
+    problems = [[] for _ in swarms]
+    for field in _METRIC_FIELDS:
+        values = [swarm[field] for swarm in swarms]
+        _, valid = parse_metrics(values)
+        for position, value in enumerate(values):
+            # Blank metrics are allowed, as in the add form
+            if value and not valid[position]:
+                problems[position].append(f"{_FIELD_COLUMNS[field]} {value!r} is not a number")
+
+    accepted, rejected = [], []
+    for position, (swarm, swarm_problems) in enumerate(zip(swarms, problems), start=1):
+        swarm_problems[:0] = [f"{_FIELD_COLUMNS[field]} is missing" for field in ("sw_week", "sw_number") if not swarm[field]]
+        if swarm_problems:
+            rejected.append(f"Swarm {position}: {', '.join(swarm_problems)}.")
+        else:
+            accepted.append(dict(swarm, comments="\n".join(split_comments(swarm["comments"]))))
+    return accepted, rejected
+
+
+def import_swarms(filename, source, fmt=None):
+    """Validate the swarms in source and append them to the ledger in one write.
+
+    Returns the added Swarm IDs and a message for every swarm that was rejected or
+    skipped as a duplicate.
+    """
+    accepted, rejected = validate_swarms(read_swarms(source, fmt))
+    added, skipped = add_swarms(filename, accepted)
+    return added, rejected + skipped
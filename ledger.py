@@ -0,0 +1,693 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+# Only the standard library, so scripts can create, add to and edit ledgers without the
+# dashboard or report dependencies; compact() imports the numpy-based sidecars itself
+import comments
+
+try:
+    import fcntl
+except ImportError:  # No advisory file locks on Windows; writers in one process still serialize
+    fcntl = None
+
+HEADER = ["Swarm ID", "Swarm Week", "Swarm Number", "Swarm URL", "Tweet Content", "Tweet Image File Name",
+          "Views", "Retweets", "Quotes", "Likes", "Bookmarks", "Comments",
+          "Ending Views", "Ending Retweets", "Ending Quotes", "Ending Likes", "Ending Bookmarks"]
+
+# add_swarm keys holding each column after the Swarm ID
+SWARM_FIELDS = ["sw_week", "sw_number", "sw_url", "tweet_content", "tweet_image_name",
+                "views", "retweets", "quotes", "likes", "bookmarks", "comments",
+                "ending_views", "ending_retweets", "ending_quotes", "ending_likes", "ending_bookmarks"]
+
+INDEX_SUFFIX = ".idx"
+JOURNAL_SUFFIX = ".journal"
+LOCK_SUFFIX = ".lock"
+SNAPSHOT_SUFFIX = ".arrow"
+ROLLUP_SUFFIX = ".rollup"
+STAMP_SUFFIX = ".stamp"
+
+# Edits are appended to the journal and folded back into the CSV once the journal
+# holds this many entries, or a quarter of the ledger if that is larger.
+COMPACT_THRESHOLD = 1000
+
+# filename -> in-memory copy of the Swarm ID index and replayed journal, with the generation
+# and the CSV and journal [inode, size, mtime] it was brought up to date with
+_states = {}
+
+# Guards the registries below; only held for a moment, never while waiting for a ledger
+_lock = threading.Lock()
+# filename -> the ledger's locks: "write" serializes its writers in this process (locked adds an
+# advisory lock on <csv>.lock so writers in other processes wait too) and "state" guards its
+# in-memory state, so readers only wait for a write itself, never for a queue of writers
+_ledger_locks = {}
+# filename -> open lock file, while this process holds its advisory lock
+_lock_files = {}
+# filename -> edit_swarm requests waiting to be written together, guarded by _pending_lock
+_pending_edits = {}
+_pending_lock = threading.Lock()
+
+# Read once, while importing is still single-threaded: os.umask can only be read by setting it
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+def write_atomically(path, write, text=False):
+    """Write a file through write(f) to a temporary file beside path, then move it into place.
+
+    For sidecars and caches, which are only ever a shortcut: returns False instead
+    of raising when the directory cannot be written, and when write returns False
+    to leave path alone. Every call gets its own temporary file, so threads and
+    processes writing the same path at once do not write into each other's.
+    """
+    directory, name = os.path.split(path)
+    try:
+        fd, temp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory or ".")
+    except OSError:
+        return False
+    replaced = False
+    try:
+        os.chmod(temp_path, 0o666 & ~_umask)  # mkstemp makes the file private to its owner
+        with open(fd, "w", encoding="utf-8", newline='') if text else open(fd, "wb") as f:
+            if write(f) is False:
+                return False
+        os.replace(temp_path, path)
+        replaced = True
+    except OSError:
+        return False
+    finally:
+        if not replaced:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    return True
+
+
+def _encode_row(row):
+    """Serialize a row exactly as csv.writer would write it to a newline='' file"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue().encode("utf-8")
+
+
+def _decode_record(data):
+    return next(csv.reader(io.StringIO(data.decode("utf-8"), newline='')), [])
+
+
+def _normalize(row):
+    """Pad or trim a row to the 17-column layout"""
+    if len(row) < len(HEADER):
+        return row + [""] * (len(HEADER) - len(row))
+    return row[:len(HEADER)]
+
+
+def _in_quotes(line, quoted):
+    """Whether a record is still inside a quoted field at the end of line, given whether it was at the start.
+
+    Follows csv.reader: a quote only opens a quoted field at the start of a field,
+    so a stray one inside an unquoted field (5" screen) is just a character.
+    """
+    i = 0
+    while True:
+        i = line.find(b'"', i)
+        if i < 0:
+            return quoted
+        if quoted:
+            if line[i + 1:i + 2] == b'"':
+                i += 1  # An escaped quote
+            else:
+                quoted = False
+        elif i == 0 or line[i - 1:i] == b",":
+            # Outside quotes a line starts a record, so both are the start of a field
+            quoted = True
+        i += 1
+
+
+def _scan_records(f, offset, end=None):
+    """Yield (offset, length, row) for every CSV record from byte offset onwards, up to byte end if given.
+
+    A record may span several physical lines when a quoted field holds newlines,
+    so lines are accumulated until the record is no longer inside a quoted field.
+    """
+    f.seek(offset)
+    parts = []
+    length = 0
+    quoted = False
+    start = offset
+    for line in f:
+        length += len(line)
+        if end is not None and start + length > end:
+            break  # Bytes a writer appends after end are left alone, even a record it is halfway through
+        parts.append(line)
+        if b'"' in line:
+            quoted = _in_quotes(line, quoted)
+        if quoted:
+            continue
+        data = b"".join(parts)
+        row = _decode_record(data)
+        if row:
+            yield start, len(data), row
+        start += len(data)
+        parts = []
+        length = 0
+
+
+def _header_length(f):
+    f.seek(0)
+    return len(f.readline())
+
+
+def _new_state():
+    return {"generation": None, "stats": None, "csv_size": 0, "journal_size": 0, "journal_entries": 0,
+            "offsets": [], "row_ids": [], "ids": {}, "overrides": {}, "comments": None}
+
+
+def _index_row(state, swarm_id, offset, row=None):
+    row_number = len(state["offsets"])
+    state["offsets"].append(offset)
+    state["row_ids"].append(swarm_id)
+    state["ids"].setdefault(swarm_id, row_number)
+    if state["comments"] is not None:
+        comments.add_row(state["comments"], row_number, _normalize(row))
+    return row_number
+
+
+def _build_index(filename):
+    """Scan the whole CSV and rewrite the persistent index; an unwritable one is only kept in memory"""
+    state = _new_state()
+    entries = []
+    with open(filename, "rb") as f:
+        end = _header_length(f)
+        for offset, length, row in _scan_records(f, end):
+            _index_row(state, row[0], offset)
+            entries.append([offset, length, row[0]])
+            end = offset + length
+    state["csv_size"] = end
+
+    write_atomically(filename + INDEX_SUFFIX, lambda idx: csv.writer(idx).writerows(entries), text=True)
+    return state
+
+
+def _load_index(filename, csv_size):
+    """The persistent index up to CSV byte csv_size, or None when it is missing or does not fit the CSV"""
+    try:
+        with open(filename + INDEX_SUFFIX, newline='', encoding="utf-8") as idx:
+            entries = list(csv.reader(idx))
+    except FileNotFoundError:
+        return None
+
+    state = _new_state()
+    with open(filename, "rb") as f:
+        end = _header_length(f)
+        for entry in entries:
+            try:
+                offset, length, swarm_id = entry[0], int(entry[1]), entry[2]
+                offset = int(offset)
+            except (ValueError, IndexError):
+                break  # A torn last entry; the rows after it are read from the CSV
+            if offset != end or offset + length > csv_size:
+                break
+            _index_row(state, swarm_id, offset)
+            end = offset + length
+        if state["offsets"]:
+            # Cheap sanity check that the index describes this CSV
+            last = next(_scan_records(f, state["offsets"][-1], end), None)
+            if last is None or last[2][0] != state["row_ids"][-1]:
+                return None
+    state["csv_size"] = end
+    return state
+
+
+def _index_end(filename):
+    """CSV offset just past the last record in the persistent index, or None if it cannot be read"""
+    try:
+        with open(filename + INDEX_SUFFIX, "rb") as idx:
+            idx.seek(max(0, idx.seek(0, os.SEEK_END) - 4096))
+            lines = idx.read().splitlines()
+    except FileNotFoundError:
+        return None
+    if not lines:
+        with open(filename, "rb") as f:
+            return _header_length(f)
+    try:
+        offset, length, _ = _decode_record(lines[-1])
+        return int(offset) + int(length)
+    except ValueError:
+        return None
+
+
+def _extend_index(filename):
+    """Add the records the persistent index is missing, e.g. after a writer died between the two writes.
+
+    Only writers call it, under locked(), so no other process is appending to either file.
+    """
+    index_end = _index_end(filename)
+    if index_end is None:
+        return
+    try:
+        with open(filename, "rb") as f, open(filename + INDEX_SUFFIX, "a", newline='', encoding="utf-8") as idx:
+            csv.writer(idx).writerows([offset, length, row[0]] for offset, length, row in _scan_records(f, index_end))
+    except OSError:
+        pass
+
+
+def _apply_edit(state, row_number, column, value):
+    state["overrides"].setdefault(row_number, {})[column] = value
+    if state["comments"] is not None:
+        comments.edit_row(state["comments"], row_number, column, value)
+    state["journal_entries"] += 1
+    if column == 0:
+        old_id = state["row_ids"][row_number]
+        if state["ids"].get(old_id) == row_number:
+            del state["ids"][old_id]
+        state["row_ids"][row_number] = value
+        state["ids"].setdefault(value, row_number)
+
+
+def _refresh(filename, state, stats):
+    """Pick up the rows and edits ledger writers appended, up to the CSV and journal sizes in stats"""
+    csv_size = stats[0][1]
+    journal_size = stats[1][1] if stats[1] else 0
+    if csv_size < state["csv_size"] or journal_size < state["journal_size"]:
+        return None
+    if csv_size > state["csv_size"]:
+        with open(filename, "rb") as f:
+            for offset, length, row in _scan_records(f, state["csv_size"], csv_size):
+                _index_row(state, row[0], offset, row)
+                state["csv_size"] = offset + length
+    if journal_size > state["journal_size"]:
+        with open(filename + JOURNAL_SUFFIX, "rb") as journal:
+            for _, length, (row_number, column, value) in _scan_records(journal, state["journal_size"], journal_size):
+                _apply_edit(state, int(row_number), int(column), value)
+                state["journal_size"] += length
+    state["stats"] = stats
+    return state
+
+
+def _stats(filename):
+    """[inode, size, mtime] of the CSV and of the journal (None while there is none)"""
+    stat = os.stat(filename)
+    stats = [[stat.st_ino, stat.st_size, stat.st_mtime_ns]]
+    try:
+        stat = os.stat(filename + JOURNAL_SUFFIX)
+    except FileNotFoundError:
+        stats.append(None)
+    else:
+        stats.append([stat.st_ino, stat.st_size, stat.st_mtime_ns])
+    return stats
+
+
+def _read_stamp(filename):
+    try:
+        with open(filename + STAMP_SUFFIX, encoding="utf-8") as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stamp if isinstance(stamp, dict) and {"generation", "stats"} <= stamp.keys() else None
+
+
+def _stamp(filename, state):
+    """Record the CSV and journal as a writer left them, so readers can tell the ledger's own
+    appends from changes made to the files any other way"""
+    state["stats"] = _stats(filename)
+    # Without a stamp every other process indexes the ledger afresh
+    write_atomically(filename + STAMP_SUFFIX,
+                     lambda f: json.dump({"generation": state["generation"], "stats": state["stats"]}, f), text=True)
+
+
+def _reindex(filename):
+    """Index the ledger from scratch under a new generation; the caller holds the write lock"""
+    state = _build_index(filename)
+    state["generation"] = os.urandom(8).hex()
+    state = _refresh(filename, state, _stats(filename))
+    _stamp(filename, state)
+    _states[filename] = state
+    return state
+
+
+def _load_state(filename, rebuild=False):
+    """Bring the in-memory state up to date, or return None when that needs the write lock.
+
+    While the files match the stamp only ledger writers have touched them, so the
+    index is trusted and whatever follows it is whole rows and edits. Anything else
+    (an edit in a spreadsheet, a writer halfway through a write) is left to rebuild,
+    which the caller sets when it holds the write lock.
+    """
+    stats = _stats(filename)
+    state = _states.get(filename)
+    if state is not None and state["stats"] == stats:
+        return state
+    stamp = _read_stamp(filename)
+    if stamp is None or stamp["stats"] != stats:
+        state = None
+    elif state is None or state["generation"] != stamp["generation"]:
+        # New to this process, or rewritten by create_csv or compact in another one
+        state = _load_index(filename, stats[0][1])
+        if state is not None:
+            state["generation"] = stamp["generation"]
+    if state is not None:
+        state = _refresh(filename, state, stats)
+    if state is None:
+        return _reindex(filename) if rebuild else None
+    _states[filename] = state
+    return state
+
+
+def _locks(filename):
+    with _lock:
+        locks = _ledger_locks.get(filename)
+        if locks is None:
+            locks = _ledger_locks[filename] = {"write": threading.RLock(), "state": threading.RLock()}
+        return locks
+
+
+def _state(filename):
+    """The ledger's in-memory state, brought up to date with the CSV and journal.
+
+    The generation changes whenever the ledger is indexed afresh, so sidecars built
+    from older files can tell they are stale.
+    """
+    locks = _locks(filename)
+    with locks["state"]:
+        state = _load_state(filename)
+    if state is not None:
+        return state
+    with locked(filename), locks["state"]:
+        return _load_state(filename, rebuild=True)
+
+
+@contextmanager
+def locked(filename):
+    """Hold the ledger's write lock, both across threads and across processes; re-entrant"""
+    with _locks(filename)["write"]:
+        # Only the thread holding "write" can have registered the lock file
+        if filename in _lock_files:
+            yield
+            return
+        try:
+            lock_file = open(filename + LOCK_SUFFIX, "a")
+        except OSError:
+            # A read-only directory, where no process can write the ledger anyway
+            lock_file = None
+        try:
+            if fcntl is not None and lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _lock_files[filename] = lock_file
+            yield
+        finally:
+            _lock_files.pop(filename, None)
+            if lock_file is not None:
+                lock_file.close()
+
+
+@contextmanager
+def _writing(filename):
+    """locked(), plus the state lock while the files and the in-memory state are updated together"""
+    with locked(filename), _locks(filename)["state"]:
+        yield
+
+
+def _drop_sidecars(filename):
+    _states.pop(filename, None)
+    for suffix in (INDEX_SUFFIX, JOURNAL_SUFFIX, SNAPSHOT_SUFFIX, ROLLUP_SUFFIX):
+        try:
+            os.remove(filename + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def create_csv(filename):
+    with _writing(filename):
+        temp_filename = filename + ".new"
+        with open(temp_filename, "w", newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(HEADER)
+        os.replace(temp_filename, filename)
+        _drop_sidecars(filename)
+        _reindex(filename)
+
+
+def _swarm_row(swarm_data):
+    sw_id = f"SW-{swarm_data['sw_week']}-{swarm_data['sw_number']}"
+    return [sw_id] + [swarm_data[field] for field in SWARM_FIELDS]
+
+
+def _append_rows(filename, state, rows):
+    """Append rows to the CSV in one write and index them; a failed write is rolled back"""
+    data = [_encode_row(row) for row in rows]
+    with open(filename, "ab") as csvfile:
+        offset = csvfile.seek(0, os.SEEK_END)
+        try:
+            csvfile.write(b"".join(data))
+            csvfile.flush()
+        except BaseException:
+            csvfile.truncate(offset)
+            raise
+    if offset == state["csv_size"]:
+        for row, encoded in zip(rows, data):
+            _index_row(state, row[0], offset, ["" if value is None else str(value) for value in row])
+            offset += len(encoded)
+        state["csv_size"] = offset
+    else:
+        # Bytes the index does not cover come first; reload the state from the files
+        _states.pop(filename, None)
+    _extend_index(filename)
+    _stamp(filename, state)
+
+
+def add_swarm(filename, swarm_data):
+    row = _swarm_row(swarm_data)
+    with _writing(filename):
+        _append_rows(filename, _state(filename), [row])
+    return row[0]
+
+
+def add_swarms(filename, swarms):
+    """Add many swarms in one write, skipping any whose Swarm ID is already in the ledger or the batch.
+
+    Returns the added Swarm IDs and a message for each skipped swarm.
+    """
+    with _writing(filename):
+        state = _state(filename)
+        rows, skipped, seen = [], [], set()
+        for swarm_data in swarms:
+            row = _swarm_row(swarm_data)
+            if row[0] in state["ids"] or row[0] in seen:
+                skipped.append(f"Swarm ID {row[0]} already exists.")
+                continue
+            seen.add(row[0])
+            rows.append(row)
+        if rows:
+            _append_rows(filename, state, rows)
+    return [row[0] for row in rows], skipped
+
+
+def _write_edits(filename, requests):
+    """Journal a batch of queued edits in one write and store each request's result message"""
+    state = _state(filename)
+    data = []
+    for request in requests:
+        swarm_id, column_to_edit, new_value = request["edit"]
+        row_number = state["ids"].get(swarm_id)
+        if row_number is None:
+            request["result"] = f"Swarm ID {swarm_id} not found."
+            continue
+        data.append(_encode_row([row_number, column_to_edit, new_value]))
+        _apply_edit(state, row_number, column_to_edit, new_value)
+        request["result"] = f"Swarm {swarm_id} updated."
+    if not data:
+        return
+
+    with open(filename + JOURNAL_SUFFIX, "ab") as journal:
+        offset = journal.seek(0, os.SEEK_END)
+        try:
+            journal.write(b"".join(data))
+            journal.flush()
+        except BaseException:
+            journal.truncate(offset)
+            # The edits were already applied in memory; reload the state from disk
+            _states.pop(filename, None)
+            raise
+    state["journal_size"] = offset + sum(len(entry) for entry in data)
+    _stamp(filename, state)
+
+
+def edit_swarm(filename, swarm_id, column_to_edit, new_value):
+    """Set one column of a swarm; returns a message saying whether it was updated.
+
+    Edits are queued, and whichever caller gets the write lock first journals every
+    queued edit in one write (group commit), so concurrent editors share writes.
+    """
+    request = {"edit": (swarm_id, column_to_edit, new_value)}
+    with _pending_lock:
+        _pending_edits.setdefault(filename, []).append(request)
+    needs_compaction = False
+    with locked(filename):
+        if "result" not in request and "error" not in request:
+            with _pending_lock:
+                batch = _pending_edits.pop(filename, [])
+            try:
+                with _locks(filename)["state"]:
+                    _write_edits(filename, batch)
+            except BaseException as error:
+                for queued in batch:
+                    queued.setdefault("error", error)
+            else:
+                state = _state(filename)
+                needs_compaction = state["journal_entries"] >= max(COMPACT_THRESHOLD, len(state["offsets"]) // 4)
+    if needs_compaction:
+        # Once the write lock is released: compact() brings the rollup up to date before taking it
+        compact(filename)
+    if "error" in request:
+        raise request["error"]
+    return request["result"]
+
+
+def comment_store(filename):
+    """The ledger's comment store (see comments.build_store).
+
+    It is tokenized on first use and then kept current by add_swarm, edit_swarm and
+    any rows or edits appended by other processes.
+    """
+    with _locks(filename)["state"]:
+        state = _state(filename)
+        if state["comments"] is None:
+            state["comments"] = comments.build_store(iter_rows(filename))
+        return state["comments"]
+
+
+def forget(filename):
+    """Drop the in-memory state of the ledger; the next read loads it from the files, as a new process would"""
+    with _locks(filename)["state"]:
+        _states.pop(filename, None)
+
+
+def position(filename):
+    """(generation, CSV size, journal size) of the ledger's current rows and edits.
+
+    A sidecar built from the ledger keeps these: while the generation is the same,
+    the files still start with the bytes it was built from, and read_rows and
+    read_edits return what was appended since.
+    """
+    state = _state(filename)
+    return state["generation"], state["csv_size"], state["journal_size"]
+
+
+def read_rows(filename, offset, end=None):
+    """Rows of the records from byte offset (up to end), as written (without journalled edits), and the end offset"""
+    rows = []
+    with open(filename, "rb") as f:
+        for start, length, row in _scan_records(f, offset, end):
+            rows.append(_normalize(row))
+            offset = start + length
+    return rows, offset
+
+
+def read_edits(filename, offset, end=None):
+    """(row number, column, value) journal entries from byte offset (up to end), and the end offset"""
+    edits = []
+    try:
+        with open(filename + JOURNAL_SUFFIX, "rb") as journal:
+            for start, length, (row_number, column, value) in _scan_records(journal, offset, end):
+                edits.append((int(row_number), int(column), value))
+                offset = start + length
+    except FileNotFoundError:
+        pass
+    return edits, offset
+
+
+def _open_rows(filename):
+    """The ledger's state and its CSV opened for reading, making sure both describe the same file"""
+    while True:
+        state = _state(filename)
+        f = open(filename, "rb")
+        if os.fstat(f.fileno()).st_ino == state["stats"][0][0]:
+            return state, f
+        f.close()  # Replaced by a compaction in between
+
+
+def get_rows(filename, row_numbers):
+    """Current rows for some row numbers, reading only those records from disk"""
+    state, f = _open_rows(filename)
+    rows = []
+    with f:
+        for row_number in row_numbers:
+            _, _, row = next(_scan_records(f, state["offsets"][row_number]))
+            row = _normalize(row)
+            for column, value in state["overrides"].get(row_number, {}).items():
+                row[column] = value
+            rows.append(row)
+    return rows
+
+
+def get_swarm(filename, swarm_id):
+    """Return the current row for a Swarm ID, or None, reading only that record from disk"""
+    row_number = _state(filename)["ids"].get(swarm_id)
+    if row_number is None:
+        return None
+    return get_rows(filename, [row_number])[0]
+
+
+def iter_rows(filename):
+    """Yield every data row in the 17-column layout with journalled edits applied"""
+    state, f = _open_rows(filename)
+    overrides = state["overrides"]
+    with f:
+        for row_number, (_, _, row) in enumerate(_scan_records(f, _header_length(f), state["csv_size"])):
+            row = _normalize(row)
+            for column, value in overrides.get(row_number, {}).items():
+                row[column] = value
+            yield row
+
+
+def open_csv(filename):
+    """Open the ledger as a CSV text stream that reflects every edit.
+
+    When nothing is journalled this is the file itself; otherwise the current
+    rows are exported into memory.
+    """
+    if not _state(filename)["overrides"]:
+        return open(filename, newline='', encoding="utf-8")
+    buffer = io.StringIO(newline='')
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    writer.writerows(iter_rows(filename))
+    buffer.seek(0)
+    return buffer
+
+
+def export_csv(filename, out_filename):
+    """Write the ledger, edits included, to out_filename in the 17-column layout"""
+    rows = iter_rows(filename)
+    with open(out_filename, "w", newline='', encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+
+
+def compact(filename):
+    """Fold the edit journal back into the CSV and rebuild the index"""
+    import rollup
+    import snapshot
+
+    # Bring the weekly rollup up to date while the journal still exists; compaction leaves its sums
+    # unchanged. It is updated before the write lock is taken and rebased once it is released.
+    rollup.update(filename)
+    with _writing(filename):
+        if not _state(filename)["overrides"]:
+            return
+        before = position(filename)
+        temp_filename = filename + ".compact"
+        export_csv(filename, temp_filename)
+        os.replace(temp_filename, filename)
+        _drop_sidecars(filename)
+        _reindex(filename)
+        after = position(filename)
+    rollup.rebase(filename, before, after)
+
+    # The snapshot covered the old file layout; rebuild it for the rewritten CSV
+    snapshot.refresh(filename)
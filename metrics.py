@@ -0,0 +1,137 @@
+import numpy as np
+from comments import split_comments
+
+METRICS = ["Views", "Retweets", "Quotes", "Likes", "Bookmarks"]
+ENDING_METRICS = [f"Ending {key}" for key in METRICS]
+# Columns of the per-week sums aggregate() builds and totals_from_sums() reads
+SUM_COLUMNS = METRICS + ENDING_METRICS + ["Swarms", "Comments"]
+_MAGNITUDES = {"k": 1_000, "m": 1_000_000, "b": 1_000_000_000}
+
+
+def parse_metrics(values):
+    """Parse a whole column of metric cells like "1,234", "12.3k" or "2m" in one call.
+
+    Returns a float array and a boolean validity mask; blank or unparseable cells
+    are NaN in the array and False in the mask.
+    """
+    cells = np.asarray(list(values), dtype=str)
+    if cells.size == 0:
+        return np.zeros(0), np.zeros(0, dtype=bool)
+    cells = np.char.lower(np.char.strip(np.char.replace(cells, ",", "")))
+    body = np.char.rstrip(cells, "kmb")
+    suffix_length = np.char.str_len(cells) - np.char.str_len(body)
+
+    multipliers = np.ones(cells.shape)
+    for suffix, magnitude in _MAGNITUDES.items():
+        multipliers[(suffix_length == 1) & np.char.endswith(cells, suffix)] = magnitude
+    # Blank cells, a bare suffix or more than one suffix ("1kk") are not numbers
+    blank = (np.char.str_len(body) == 0) | (suffix_length > 1)
+    body[blank] = "0"
+
+    try:
+        numbers = body.astype(float)
+    except ValueError:
+        # Rare garbage cells: fall back to converting one at a time
+        numbers = np.empty(body.shape)
+        for i, cell in enumerate(body):
+            try:
+                numbers[i] = float(cell)
+            except ValueError:
+                numbers[i] = np.nan
+    numbers *= multipliers
+    valid = np.isfinite(numbers) & ~blank
+    numbers[~valid] = np.nan
+    return numbers, valid
+
+def format_number(number):
+    """Convert a number into a string with 'k', 'm', 'b' postfix for thousands, millions, billions"""
+    if number >= 1_000_000_000:
+        return f"{number / 1_000_000_000:.0f}b"
+    elif number >= 1_000_000:
+        return f"{number / 1_000_000:.0f}m"
+    elif number >= 1_000:
+        return f"{number / 1_000:.0f}k"
+    else:
+        return f"{number:.0f}"
+
+def format_numbers(values, missing=""):
+    """Bulk version of format_number for an array of values; NaN becomes `missing`"""
+    values = np.asarray(values, dtype=float)
+    valid = np.isfinite(values)
+    safe = np.where(valid, values, 0.0)
+    divisors = np.select([safe >= 1_000_000_000, safe >= 1_000_000, safe >= 1_000], [1_000_000_000, 1_000_000, 1_000], 1)
+    suffixes = np.select([safe >= 1_000_000_000, safe >= 1_000_000, safe >= 1_000], ["b", "m", "k"], "")
+    formatted = np.char.add(np.char.mod("%.0f", safe / divisors), suffixes)
+    return np.where(valid, formatted, missing).tolist()
+
+def percentage_changes(old, new):
+    """Percentage change from old to new per element, formatted like "25%"; a zero or missing start gives "0%" """
+    old = np.asarray(old, dtype=float)
+    new = np.asarray(new, dtype=float)
+    defined = np.isfinite(old) & np.isfinite(new) & (old != 0)
+    change = np.divide(new - old, old, out=np.zeros(old.shape), where=defined) * 100
+    return np.char.add(np.char.mod("%.0f", change), "%").tolist()
+
+def count_comments(values):
+    """Number of comments in each cell of a Comments column, split as comments.split_comments does"""
+    return np.array([len(split_comments(v)) for v in values], dtype=np.int64)
+
+def aggregate(weeks, initial, ending, comments=None, selected_weeks=None):
+    """Group every metric by week in a single pass and derive the weekly and overall figures.
+
+    `weeks` holds the week label of each row, `initial` and `ending` map each name in
+    METRICS to a per-row float array (as returned by parse_metrics) and `comments` is an
+    optional per-row comment count. Missing (NaN) values count as 0. Overall figures
+    cover `selected_weeks` (default: all).
+
+    Returns a dict with the sorted week labels under "weeks", per-week arrays under
+    "swarms", "comments", "initial_total" and "ending_total", per-metric dicts of
+    per-week arrays under "initial", "ending" and "additional", and an "overall" dict
+    with "swarms", "comments" and per-metric "initial", "ending", "additional" and
+    "average" totals.
+    """
+    labels, inverse = np.unique(np.asarray(weeks), return_inverse=True)
+    columns = [initial[key] for key in METRICS] + [ending[key] for key in METRICS]
+    columns.append(np.ones(len(inverse)))
+    columns.append(comments if comments is not None else np.zeros(len(inverse)))
+    values = np.nan_to_num(np.column_stack([np.asarray(c, dtype=float) for c in columns]))
+
+    sums = np.zeros((len(labels), values.shape[1]))
+    np.add.at(sums, inverse.ravel(), values)
+    return totals_from_sums(labels.tolist(), sums, selected_weeks)
+
+def totals_from_sums(weeks, sums, selected_weeks=None):
+    """The aggregate() result for per-week sums.
+
+    `sums` has one row per label in `weeks` and the columns of SUM_COLUMNS: the
+    initial and ending METRICS, the number of swarms and the number of comments.
+    """
+    n_metrics = len(METRICS)
+    sums = np.asarray(sums, dtype=float).reshape(len(weeks), len(SUM_COLUMNS))
+    per_week = {
+        "weeks": list(weeks),
+        "initial": {key: sums[:, i] for i, key in enumerate(METRICS)},
+        "ending": {key: sums[:, n_metrics + i] for i, key in enumerate(METRICS)},
+        "swarms": sums[:, -2].astype(np.int64),
+        "comments": sums[:, -1].astype(np.int64),
+    }
+    per_week["additional"] = {key: per_week["ending"][key] - per_week["initial"][key] for key in METRICS}
+    per_week["initial_total"] = sums[:, :n_metrics].sum(axis=1)
+    per_week["ending_total"] = sums[:, n_metrics:2 * n_metrics].sum(axis=1)
+
+    per_week["overall"] = summarize(per_week, selected_weeks)
+    return per_week
+
+def summarize(per_week, selected_weeks=None):
+    """Overall totals and averages over `selected_weeks` (default: all) of an aggregate() result"""
+    if selected_weeks is None:
+        chosen = np.ones(len(per_week["weeks"]), dtype=bool)
+    else:
+        selected_weeks = set(selected_weeks)
+        chosen = np.array([week in selected_weeks for week in per_week["weeks"]], dtype=bool)
+    swarms = int(per_week["swarms"][chosen].sum())
+    overall = {"swarms": swarms, "comments": int(per_week["comments"][chosen].sum())}
+    for name in ("initial", "ending", "additional"):
+        overall[name] = {key: float(per_week[name][key][chosen].sum()) for key in METRICS}
+    overall["average"] = {key: value / swarms if swarms else 0.0 for key, value in overall["additional"].items()}
+    return overall
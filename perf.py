@@ -0,0 +1,82 @@
+import cProfile
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Timers and counters are kept per thread, since every Streamlit session runs in its own thread
+_local = threading.local()
+
+
+def start_run(label):
+    """Start collecting timers and counters for a new run (a report, a dashboard rerun) in this thread"""
+    _local.run = {"label": label, "started": datetime.now().isoformat(timespec="seconds"),
+                  "timers": {}, "counters": {}}
+    return _local.run
+
+
+def current():
+    """The run being collected in this thread, started on first use"""
+    run = getattr(_local, "run", None)
+    return run if run is not None else start_run("default")
+
+
+@contextmanager
+def timer(name):
+    """Add the time spent in the block to the named timer of the current run"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = current()["timers"].setdefault(name, {"calls": 0, "seconds": 0.0})
+        entry["calls"] += 1
+        entry["seconds"] += time.perf_counter() - start
+
+
+def count(name, amount=1):
+    counters = current()["counters"]
+    counters[name] = counters.get(name, 0) + amount
+
+
+def write_log(path, run=None):
+    """Append a run to a JSON lines log, one object per run"""
+    run = run or current()
+    with open(path, "a", encoding="utf-8") as log:
+        log.write(json.dumps(run) + "\n")
+
+
+def rows(run=None):
+    """(name, calls, milliseconds) per timer of a run, slowest first"""
+    run = run or current()
+    return sorted(((name, entry["calls"], entry["seconds"] * 1000) for name, entry in run["timers"].items()),
+                  key=lambda row: -row[2])
+
+
+def start_profile(path):
+    """Start a cProfile profiler when path is set; pass the result to stop_profile"""
+    if not path:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process; a run overlapping another goes unprofiled
+        return None
+    return profiler
+
+
+def stop_profile(profiler, path):
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+@contextmanager
+def profiled(path):
+    """Profile the block with cProfile and dump the stats to path; does nothing when path is empty"""
+    profiler = start_profile(path)
+    try:
+        yield
+    finally:
+        stop_profile(profiler, path)
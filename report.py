@@ -1,54 +1,53 @@
+import argparse
 import csv
-import matplotlib.pyplot as plt
-import tempfile
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from docx.oxml.ns import nsdecls
-from docx.oxml import parse_xml
-import matplotlib.ticker as ticker
+import hashlib
+import io
+import itertools
+import json
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from docx.shared import Inches
 import os
-
-
-def string_to_float(s):
-    """Convert a string with optional 'k', 'm', 'b' postfix to numeric values (thousand, million, billion)"""
-    s = s.strip().lower()
-    if s[-1] in ['k', 'm', 'b']:
-        num, magnitude = s[:-1], s[-1]
-        if magnitude == 'k':
-            return float(num) * 1_000
-        elif magnitude == 'm':
-            return float(num) * 1_000_000
-        elif magnitude == 'b':
-            return float(num) * 1_000_000_000
-    else:
-        return float(s)
-
-def format_number(number):
-    """Convert a number into a string with 'k', 'm', 'b' postfix for thousands, millions, billions"""
-    if number >= 1_000_000_000:
-        return f"{number / 1_000_000_000:.0f}b"
-    elif number >= 1_000_000:
-        return f"{number / 1_000_000:.0f}m"
-    elif number >= 1_000:
-        return f"{number / 1_000:.0f}k"
-    else:
-        return f"{number:.0f}"
-
-def percentage_change(old, new):
-    old = string_to_float(old.replace(',', ''))
-    new = string_to_float(new.replace(',', ''))
-    if old == 0:
-        return "0%"
-    change = ((new - old) / old) * 100
-    return f"{change:.0f}%"
-
-def get_total_additional_engagements(initial_key, ending_key, indices, all_data):
-    total_initial = sum(string_to_float(row[indices[initial_key]]) if row[indices[initial_key]].strip() else 0 for row in all_data)
-    total_ending = sum(string_to_float(row[indices[ending_key]]) if row[indices[ending_key]].strip() else 0 for row in all_data)
-    return total_ending - total_initial
+import perf
+# python-docx, matplotlib (see charts) and pyarrow (see snapshot) are imported by the
+# functions that use them, so the prompt and --help appear without loading them
+from charts import PRESETS, render_bar_chart, render_charts
+from docxstream import DocxStreamWriter, heading_xml, lines_xml, page_break_xml, paragraph_xml, table_xml
+import comments
+from comments import split_comments
+import rollup
+from ledger import HEADER, comment_store, open_csv, write_atomically
+from metrics import METRICS, ENDING_METRICS, format_number, format_numbers, parse_metrics, percentage_changes, summarize
+
+
+# Chart quality preset from charts.PRESETS: "print" (300 dpi) or "draft"
+CHART_PRESET = "print"
+# Processes used to render the report's charts; 1 renders them serially in this process. Each worker
+# pays for importing matplotlib, so more only pays off for several reports at print quality.
+CHART_WORKERS = 1
+LOGO_FILE = 'beego.png'
+# Fonts and header/footer text baked into the cached report template
+TEMPLATE_STYLE = {
+    "font": 'Helvetica Neue',
+    "size": 12,
+    "logo_width": 2.0,
+    "header": 'LBC Swarm Campaign Report',
+    "footer": 'Private and Confidential',
+}
+# Bump when _build_template changes so cached templates are rebuilt
+TEMPLATE_VERSION = 1
+TEMPLATE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "beetrack")
+# Rows parsed at a time when reading the CSV
+REPORT_CHUNK_ROWS = 5000
+# Ledger columns the report reads
+REPORT_COLUMNS = ["Swarm Number", "Swarm URL", "Views", "Retweets", "Quotes", "Likes", "Bookmarks", "Ending Views",
+                  "Ending Retweets", "Ending Quotes", "Ending Likes", "Ending Bookmarks", "Comments", "Swarm Week"]
+# EMU per twip, for table widths in streamed sections
+TWIP = 635
+
+# template key -> saved DOCX holding the front matter every report shares
+_skeletons = {}
+# parsed ledger handed to each worker process once by generate_reports
+_worker_data = None
 
 def add_summary_table(document, data, title):
     table = document.add_table(rows=2, cols=len(data) + 1)
@@ -59,33 +58,27 @@ def add_summary_table(document, data, title):
         table.cell(1, i).text = format_number(value)
     document.add_paragraph("\n")
 
-def add_bar_graph(document, data, title, xlabel, ylabel, color):
-    # Plot the bar graph using matplotlib
-    fig, ax = plt.subplots()
-    ax.bar(data.keys(), data.values(), color=color)
-    ax.set_title(title)
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-
-    # Format y-axis labels
-    def custom_formatter(x, _):
-        return format_number(x)
+def add_picture_full_width(document, image):
+    document.add_picture(io.BytesIO(image), width=document.sections[-1].page_width - document.sections[-1].left_margin - document.sections[-1].right_margin)
 
-    ax.yaxis.set_major_formatter(ticker.FuncFormatter(custom_formatter))
+def add_bar_graph(document, data, title, xlabel, ylabel, color, preset=CHART_PRESET):
+    # Render the bar graph into memory and add it to the document as an image
+    add_picture_full_width(document, render_bar_chart(data, title, xlabel, ylabel, color, preset))
 
-    # Save the bar graph to a temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-    plt.savefig(temp_file.name, dpi=300, bbox_inches='tight')
-    temp_file.close()
+def add_bar_graphs(document, charts, preset=CHART_PRESET, workers=CHART_WORKERS):
+    """Render a list of add_bar_graph keyword dicts, in a process pool when workers > 1, and add them in order"""
+    with perf.timer("report: render charts"):
+        images = render_charts(charts, preset, workers)
+    perf.count("charts", len(images))
+    with perf.timer("report: add charts"):
+        for image in images:
+            add_picture_full_width(document, image)
 
-    # Add the bar graph as an image to the document
-    document.add_picture(temp_file.name, width=document.sections[-1].page_width - document.sections[-1].left_margin - document.sections[-1].right_margin)
-    plt.close()
+def tables_and_comments(document, initial, ending, change, comment_list=None):
+    """Add the per-swarm tables, and the swarm's comments unless comment_list is None.
 
-    # Delete the temporary file
-    temp_file.delete = True
-
-def tables_and_comments(document, indices, row):
+    initial, ending and change hold the swarm's preformatted metric cells.
+    """
     # First table
     stats_table = document.add_table(rows=2, cols=6)
     stats_table.style = 'Table Grid'
@@ -97,8 +90,8 @@ def tables_and_comments(document, indices, row):
 
     stats_table.cell(1, 0).text = "Initial"
 
-    for i, key in enumerate(["Views", "Retweets", "Quotes", "Likes", "Bookmarks"]):
-        stats_table.cell(1, i + 1).text = format_number(float(row[indices[key]]))
+    for i, text in enumerate(initial):
+        stats_table.cell(1, i + 1).text = text
 
     document.add_paragraph("\n")
 
@@ -112,151 +105,446 @@ def tables_and_comments(document, indices, row):
     ending_table.cell(1, 0).text = "Ending"
     ending_table.cell(2, 0).text = "% Change"
 
-    for i, key in enumerate(["Ending Views", "Ending Retweets", "Ending Quotes", "Ending Likes", "Ending Bookmarks"]):
-        ending_table.cell(1, i + 1).text = format_number(float(row[indices[key]]))
-        ending_table.cell(2, i + 1).text = percentage_change(stats_table.cell(1, i + 1).text, ending_table.cell(1, i + 1).text)
+    for i, (ending_text, change_text) in enumerate(zip(ending, change)):
+        ending_table.cell(1, i + 1).text = ending_text
+        ending_table.cell(2, i + 1).text = change_text
 
-    if include_comments.lower() == 'yes':
-        comments = row[indices["Comments"]].split('\n')
+    if comment_list is not None:
         document.add_heading("Comments:", level=2)
-        comments_list = document.add_paragraph()
-        for i, comment in enumerate(comments, start=1):
-            comments_list.add_run(f"{i}. {comment.strip()}\n")
+        comments_paragraph = document.add_paragraph()
+        for i, comment in enumerate(comment_list, start=1):
+            comments_paragraph.add_run(f"{i}. {comment}\n")
 
     document.add_page_break()
 
-input_file = input("Enter the CSV file path: ")
-output_file = input("Enter the output DOCX file path: ")
-include_comments = input("Do you wish to include comments in the report? [yes/no]: ")
-
-# Remove ".docx", capitalize each word for report title
-report_title = os.path.splitext(output_file)[0].replace('_', ' ').title()
-date = datetime.today().strftime('%Y-%m-%d')  # Get today's date
-  
-document = Document()
-
-# Add beego logo and center it
-document.add_picture('beego.png', width=Inches(2.0))
-last_paragraph = document.paragraphs[-1] 
-last_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-
-# Add report title and center it
-title_paragraph = document.add_paragraph()
-title_run = title_paragraph.add_run(report_title)
-title_run.font.name = 'Helvetica Neue'
-title_run.font.size = Pt(24)
-title_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-
-# Add date and center it
-date_paragraph = document.add_paragraph()
-date_run = date_paragraph.add_run(date)
-date_run.font.size = Pt(12)
-date_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-
-document.add_page_break()
-
-# Set font for whole document
-style = document.styles['Normal']
-font = style.font
-font.name = 'Helvetica Neue'
-font.size = Pt(12)
-
-# Set font for all heading styles used
-for heading_level in range(1, 10):
-    style = document.styles[f'Heading {heading_level}']
-    font = style.font
-    font.name = 'Helvetica Neue'
-    font.size = Pt(12)
-
-document.add_heading("Summary", level=1)
-
-# Header and Footer
-section = document.sections[0]
-header = section.header
-header_paragraph = header.paragraphs[0]
-header_text = header_paragraph.add_run('LBC Swarm Campaign Report')
-header_text.font.name = 'Helvetica Neue'
-header_text.font.size = Pt(12)
-header_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-
-footer = section.footer
-footer_paragraph = footer.paragraphs[0]
-footer_text = footer_paragraph.add_run('Private and Confidential')
-footer_text.font.name = 'Helvetica Neue'
-footer_text.font.size = Pt(12)
-footer_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-
-with open(input_file, newline='') as csvfile:
-    csv_data = csv.reader(csvfile)
-    header = next(csv_data)
-
-    indices = {name: header.index(name) for name in ["Swarm Number", "Swarm URL", "Views", "Retweets", "Quotes", "Likes", "Bookmarks", "Ending Views", "Ending Retweets", "Ending Quotes", "Ending Likes", "Ending Bookmarks", "Comments", "Swarm Week"]}
 
-    all_data = list(csv_data)
-    weeks = sorted(list(set(row[indices["Swarm Week"]] for row in all_data)))
-    print(f"Available weeks: {', '.join(weeks)}")
+def _template_key(logo_file):
+    """Hash of everything baked into the template, so a changed logo or style setting builds a new one"""
+    import docx
 
-    selected_week = input(f"Choose a week to create the report for, or enter 'all' for all weeks: ")
+    digest = hashlib.sha256()
+    with open(logo_file, "rb") as logo:
+        digest.update(logo.read())
+    digest.update(json.dumps(TEMPLATE_STYLE, sort_keys=True).encode())
+    digest.update(f"{TEMPLATE_VERSION}:{docx.__version__}".encode())
+    return digest.hexdigest()[:16]
 
-    if selected_week.lower() == 'all':
-        report_data = all_data
-    else:
-        report_data = [row for row in all_data if row[indices["Swarm Week"]] == selected_week]
+def _build_template(logo_file):
+    from docx import Document
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+    from docx.shared import Inches, Pt
 
-    total_comments = sum(1 for row in report_data for _ in row[indices['Comments']].split('\n') if row[indices['Comments']].strip())
-    document.add_paragraph(f"Total Comments for Week {selected_week}: {format_number(total_comments)}")
-    document.add_paragraph(f"Total Swarms for Week {selected_week}: {len(report_data)}")
+    style_settings = TEMPLATE_STYLE
+    document = Document()
 
-    total_additional_engagements = {
-        'Views': get_total_additional_engagements("Views", "Ending Views", indices, report_data),
-        'Retweets': get_total_additional_engagements("Retweets", "Ending Retweets", indices, report_data),
-        'Quotes': get_total_additional_engagements("Quotes", "Ending Quotes", indices, report_data),
-        'Likes': get_total_additional_engagements("Likes", "Ending Likes", indices, report_data),
-        'Bookmarks': get_total_additional_engagements("Bookmarks", "Ending Bookmarks", indices, report_data)
-    }
-    add_summary_table(document, total_additional_engagements, f"Total Additional Engagements for Week {selected_week}")
+    # Add beego logo and center it
+    document.add_picture(logo_file, width=Inches(style_settings["logo_width"]))
+    last_paragraph = document.paragraphs[-1]
+    last_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
-    average_additional_engagements = {key: value / len(report_data) for key, value in total_additional_engagements.items()}
-    add_summary_table(document, average_additional_engagements, f"Total Average Engagements for Week {selected_week}")
+    # Set font for whole document
+    style = document.styles['Normal']
+    font = style.font
+    font.name = style_settings["font"]
+    font.size = Pt(style_settings["size"])
+
+    # Set font for all heading styles used
+    for heading_level in range(1, 10):
+        style = document.styles[f'Heading {heading_level}']
+        font = style.font
+        font.name = style_settings["font"]
+        font.size = Pt(style_settings["size"])
+
+    # Header and Footer
+    section = document.sections[0]
+    header = section.header
+    header_paragraph = header.paragraphs[0]
+    header_text = header_paragraph.add_run(style_settings["header"])
+    header_text.font.name = style_settings["font"]
+    header_text.font.size = Pt(style_settings["size"])
+    header_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+
+    footer = section.footer
+    footer_paragraph = footer.paragraphs[0]
+    footer_text = footer_paragraph.add_run(style_settings["footer"])
+    footer_text.font.name = style_settings["font"]
+    footer_text.font.size = Pt(style_settings["size"])
+    footer_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+def build_skeleton(logo_file=LOGO_FILE, cache_dir=None):
+    """DOCX bytes with the logo, fonts, header and footer shared by every report.
+
+    The template is built once and cached in cache_dir (default TEMPLATE_CACHE_DIR)
+    under a name derived from the logo's contents and TEMPLATE_STYLE, and in memory
+    for the rest of the process. Reports open a copy with Document(io.BytesIO(...)).
+    """
+    key = _template_key(logo_file)
+    if key in _skeletons:
+        return _skeletons[key]
+
+    cache_dir = cache_dir or TEMPLATE_CACHE_DIR
+    cache_file = os.path.join(cache_dir, f"report-template-{key}.docx")
+    try:
+        with open(cache_file, "rb") as cached:
+            template = cached.read()
+    except FileNotFoundError:
+        template = _build_template(logo_file)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError:
+            pass
+        write_atomically(cache_file, lambda cached: cached.write(template))
+
+    _skeletons[key] = template
+    return template
+
+def _read_chunks(csvfile):
+    """Column indices and an iterator over lists of at most REPORT_CHUNK_ROWS rows of a swarm CSV"""
+    csv_data = csv.reader(csvfile)
+    header = next(csv_data)
 
-    # Add bar graphs
-    total_swarms_per_week = {week: sum(1 for row in all_data if row[indices["Swarm Week"]] == week) for week in weeks}
-    add_bar_graph(document, total_swarms_per_week, "Total Swarms per Week", "Week", "Number of Swarms", color='darkorange')
+    indices = {name: header.index(name) for name in REPORT_COLUMNS}
+
+    return indices, iter(lambda: list(itertools.islice(csv_data, REPORT_CHUNK_ROWS)), [])
+
+def _csv_chunks(csvfile, indices, chunks):
+    with csvfile:
+        for rows in chunks:
+            initial = {key: parse_metrics(row[indices[key]] for row in rows)[0] for key in METRICS}
+            ending = {key: parse_metrics(row[indices[f"Ending {key}"]] for row in rows)[0] for key in METRICS}
+            yield rows, initial, ending
+
+def _snapshot_chunks(table):
+    """Row chunks of a snapshot table; metrics come already typed, so only the text cells are converted"""
+    for batch in table.to_batches(max_chunksize=REPORT_CHUNK_ROWS):
+        columns = []
+        for name in HEADER:
+            if name in METRICS or name in ENDING_METRICS:
+                # Metric cells are only read through the typed arrays below
+                columns.append([""] * batch.num_rows)
+            else:
+                columns.append(["" if cell is None else cell for cell in batch.column(name).to_pylist()])
+        initial = {key: batch.column(key).to_numpy(zero_copy_only=False) for key in METRICS}
+        ending = {key: batch.column(f"Ending {key}").to_numpy(zero_copy_only=False) for key in METRICS}
+        yield [list(row) for row in zip(*columns)], initial, ending
+
+def _open_chunks(input_file):
+    """Column indices and an iterator of (rows, initial metrics, ending metrics) chunks of the ledger.
+
+    The columnar snapshot is used when available; otherwise the CSV is parsed.
+    """
+    import snapshot
+
+    loaded = snapshot.load(input_file)
+    if loaded is not None:
+        return {name: HEADER.index(name) for name in REPORT_COLUMNS}, _snapshot_chunks(loaded[0])
+    csvfile = open_csv(input_file)
+    indices, chunks = _read_chunks(csvfile)
+    return indices, _csv_chunks(csvfile, indices, chunks)
+
+def _format_cells(initial, ending):
+    """Format the per-swarm table cells of parsed metrics in bulk"""
+    # % change is taken from the unrounded values
+    return {
+        "initial_text": [format_numbers(initial[key]) for key in METRICS],
+        "ending_text": [format_numbers(ending[key]) for key in METRICS],
+        "change_text": [percentage_changes(initial[key], ending[key]) for key in METRICS],
+    }
 
-    # Total number of Additional Engagements each week
-    total_additional_engagements_per_week = {
-        week: {key: get_total_additional_engagements(key, f"Ending {key}", indices, [row for row in report_data if row[indices["Swarm Week"]] == week])
-               for key in ["Views", "Retweets", "Quotes", "Likes", "Bookmarks"]}
-        for week in weeks
+def load_report_data(input_file, keep_rows=True):
+    """Read the swarm ledger once and parse everything the reports share.
+
+    The per-week totals come from the ledger's incremental rollup. With
+    keep_rows=False nothing else is read up front: the swarm sections re-read
+    input_file a chunk at a time so memory does not grow with the swarm count.
+    """
+    # Only the weeks whose swarms changed since the last run are re-aggregated
+    with perf.timer("load: rollup"):
+        totals = rollup.weekly_totals(input_file)
+
+    data = {
+        "source": input_file,
+        "indices": {name: HEADER.index(name) for name in REPORT_COLUMNS},
+        "weeks": totals["weeks"],
+        "totals": totals,
     }
-    for eng_type in ["Views", "Retweets", "Quotes", "Likes", "Bookmarks"]:
-        add_bar_graph(document, {week: data[eng_type] for week, data in total_additional_engagements_per_week.items()}, f"Total Additional {eng_type} per Week", "Week", f"Total Additional {eng_type}", color='darkorange')
+    if not keep_rows:
+        return data
+
+    week_column, all_data = [], []
+    cells = {"initial_text": [[] for _ in METRICS], "ending_text": [[] for _ in METRICS], "change_text": [[] for _ in METRICS]}
+    with perf.timer("load: parse"):
+        indices, chunks = _open_chunks(input_file)
+        for rows, chunk_initial, chunk_ending in chunks:
+            perf.count("rows", len(rows))
+            week_column.extend(row[indices["Swarm Week"]] for row in rows)
+            all_data.extend(rows)
+            for name, columns in _format_cells(chunk_initial, chunk_ending).items():
+                for column, chunk_column in zip(cells[name], columns):
+                    column.extend(chunk_column)
+
+    # The comment store is shared with the listings below
+    with perf.timer("load: comments"):
+        store = comment_store(input_file)
+
+    data.update(indices=indices, rows=all_data, week_column=week_column, comments=store, **cells)
+    return data
+
+def iter_swarms(data, week):
+    """Yield (week, row, initial cells, ending cells, % change cells, comments) for every swarm in a week's report"""
+    all_weeks = week.lower() == 'all'
+    if "rows" in data:
+        for i, label in enumerate(data["week_column"]):
+            if all_weeks or label == week:
+                yield (label, data["rows"][i], [column[i] for column in data["initial_text"]],
+                       [column[i] for column in data["ending_text"]], [column[i] for column in data["change_text"]],
+                       comments.row_comments(data["comments"], i))
+        return
+
+    indices, chunks = _open_chunks(data["source"])
+    for rows, initial, ending in chunks:
+        selected = [i for i, row in enumerate(rows) if all_weeks or row[indices["Swarm Week"]] == week]
+        if not selected:
+            continue
+        cells = _format_cells({key: initial[key][selected] for key in METRICS},
+                              {key: ending[key][selected] for key in METRICS})
+        for i, row_number in enumerate(selected):
+            row = rows[row_number]
+            yield (row[indices["Swarm Week"]], row, [column[i] for column in cells["initial_text"]],
+                   [column[i] for column in cells["ending_text"]], [column[i] for column in cells["change_text"]],
+                   split_comments(row[indices["Comments"]]))
+
+def swarm_section_xml(indices, row, initial, ending, change, comment_list, width):
+    """WordprocessingML for one swarm's section, matching what the heading, paragraph and tables_and_comments add"""
+    labels = ["", "Views", "Retweets", "Quotes", "Likes", "Bookmarks"]
+    parts = [
+        heading_xml(f"Swarm Number: {row[indices['Swarm Number']]}", level=1),
+        paragraph_xml(f"Swarm URL: {row[indices['Swarm URL']]}"),
+        table_xml([labels, ["Initial"] + initial], width),
+        paragraph_xml("\n"),
+        table_xml([labels, ["Ending"] + ending, ["% Change"] + change], width),
+    ]
+    if comment_list is not None:
+        parts.append(heading_xml("Comments:", level=2))
+        parts.append(lines_xml(f"{i}. {comment}" for i, comment in enumerate(comment_list, start=1)))
+    parts.append(page_break_xml())
+    return "".join(parts)
+
+def generate_report(data, week, include_comments, out, preset=CHART_PRESET, chart_workers=CHART_WORKERS,
+                    stream=False, split_weeks=False, logo_file=LOGO_FILE):
+    """Write the report for one week (or 'all') of data from load_report_data to the DOCX path out.
+
+    With stream=True the summary is built with python-docx and the per-swarm sections
+    are then streamed into the saved file as raw XML, so memory stays flat however many
+    swarms there are. split_weeks=True (streaming only) leaves the sections out of
+    `out` and writes each week's swarms to its own "<out>_week_<week>.docx" part file.
+    logo_file is the image in the header of the report and of each part file.
+    """
+    from docx import Document
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+    from docx.shared import Pt
+
+    all_weeks = week.lower() == 'all'
+    totals = data["totals"]
+    weeks = totals["weeks"]
+    overall = summarize(totals, None if all_weeks else [week])
+
+    # Remove ".docx", capitalize each word for report title
+    report_title = os.path.splitext(os.path.basename(out))[0].replace('_', ' ').title()
+    date = datetime.today().strftime('%Y-%m-%d')  # Get today's date
+
+    with perf.timer("report: summary"):
+        document = Document(io.BytesIO(build_skeleton(logo_file)))
+
+        # Add report title and center it
+        title_paragraph = document.add_paragraph()
+        title_run = title_paragraph.add_run(report_title)
+        title_run.font.name = TEMPLATE_STYLE["font"]
+        title_run.font.size = Pt(24)
+        title_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+
+        # Add date and center it
+        date_paragraph = document.add_paragraph()
+        date_run = date_paragraph.add_run(date)
+        date_run.font.size = Pt(12)
+        date_paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+
+        document.add_page_break()
+
+        document.add_heading("Summary", level=1)
+
+        document.add_paragraph(f"Total Comments for Week {week}: {format_number(overall['comments'])}")
+        document.add_paragraph(f"Total Swarms for Week {week}: {overall['swarms']}")
+
+        add_summary_table(document, overall["additional"], f"Total Additional Engagements for Week {week}")
+        add_summary_table(document, overall["average"], f"Total Average Engagements for Week {week}")
+
+    # Bar graphs, rendered together (in parallel when chart_workers > 1) and added in this order
+    charts = [dict(data=dict(zip(weeks, totals["swarms"])), title="Total Swarms per Week",
+                   xlabel="Week", ylabel="Number of Swarms", color='darkorange')]
+
+    # Total number of Additional Engagements each week, only counting the weeks in the report
+    in_report = [all_weeks or label == week for label in weeks]
+    for eng_type in METRICS:
+        additional_per_week = {label: value if included else 0
+                               for label, value, included in zip(weeks, totals["additional"][eng_type], in_report)}
+        charts.append(dict(data=additional_per_week, title=f"Total Additional {eng_type} per Week",
+                           xlabel="Week", ylabel=f"Total Additional {eng_type}", color='darkorange'))
 
     # Graph comparing the before and after engagements
-    initial_total_engagements_per_week = {
-        week: sum(sum(float(row[indices[key]]) for key in ["Views", "Retweets", "Quotes", "Likes", "Bookmarks"]) for row in all_data if row[indices["Swarm Week"]] == week)
-        for week in weeks
-    }
-    ending_total_engagements_per_week = {
-        week: sum(sum(float(row[indices[f"Ending {key}"]]) for key in ["Views", "Retweets", "Quotes", "Likes", "Bookmarks"]) for row in all_data if row[indices["Swarm Week"]] == week)
-        for week in weeks
-    }
-    add_bar_graph(document, initial_total_engagements_per_week, "Initial Total Engagements per Week", "Week", "Initial Engagements", color='darkorange')
-    add_bar_graph(document, ending_total_engagements_per_week, "Ending Total Engagements per Week", "Week", "Ending Engagements", color='darkorange')
+    charts.append(dict(data=dict(zip(weeks, totals["initial_total"])), title="Initial Total Engagements per Week",
+                       xlabel="Week", ylabel="Initial Engagements", color='darkorange'))
+    charts.append(dict(data=dict(zip(weeks, totals["ending_total"])), title="Ending Total Engagements per Week",
+                       xlabel="Week", ylabel="Ending Engagements", color='darkorange'))
 
     # Total number of comments per week
-    total_comments_per_week = {
-        week: sum(1 for row in all_data if row[indices["Swarm Week"]] == week for _ in row[indices['Comments']].split('\n') if row[indices['Comments']].strip())
-        for week in weeks
-    }
-    add_bar_graph(document, total_comments_per_week, "Total Comments per Week", "Week", "Number of Comments", color='darkorange')
-
-    for row in report_data:
-        document.add_heading(f"Swarm Number: {row[indices['Swarm Number']]}", level=1)
-        document.add_paragraph(f"Swarm URL: {row[indices['Swarm URL']]}")
-
-        tables_and_comments(document, indices, row)
-
-document.save(output_file)
-
-print("Conversion complete! DOCX file saved as", output_file)
\ No newline at end of file
+    charts.append(dict(data=dict(zip(weeks, totals["comments"])), title="Total Comments per Week",
+                       xlabel="Week", ylabel="Number of Comments", color='darkorange'))
+
+    add_bar_graphs(document, charts, preset, chart_workers)
+
+    indices = data["indices"]
+    if not stream:
+        with perf.timer("report: swarm sections"):
+            for _, row, initial, ending, change, comment_list in iter_swarms(data, week):
+                perf.count("swarms")
+                document.add_heading(f"Swarm Number: {row[indices['Swarm Number']]}", level=1)
+                document.add_paragraph(f"Swarm URL: {row[indices['Swarm URL']]}")
+
+                tables_and_comments(document, initial, ending, change, comment_list if include_comments else None)
+
+        with perf.timer("report: save"):
+            document.save(out)
+        return
+
+    section = document.sections[-1]
+    width = (section.page_width - section.left_margin - section.right_margin) // TWIP
+    if not split_weeks:
+        with perf.timer("report: save"):
+            buffer = io.BytesIO()
+            document.save(buffer)
+        with perf.timer("report: swarm sections"), DocxStreamWriter(buffer.getvalue(), out) as writer:
+            for _, row, initial, ending, change, comment_list in iter_swarms(data, week):
+                perf.count("swarms")
+                writer.write(swarm_section_xml(indices, row, initial, ending, change,
+                                               comment_list if include_comments else None, width))
+        return
+
+    with perf.timer("report: save"):
+        document.save(out)
+    stem, extension = os.path.splitext(out)
+    with perf.timer("report: swarm sections"):
+        parts = {}
+        try:
+            for label, row, initial, ending, change, comment_list in iter_swarms(data, week):
+                perf.count("swarms")
+                if label not in parts:
+                    part = Document(io.BytesIO(build_skeleton(logo_file)))
+                    part.add_heading(f"Swarms for Week {label}", level=1)
+                    buffer = io.BytesIO()
+                    part.save(buffer)
+                    parts[label] = DocxStreamWriter(buffer.getvalue(), f"{stem}_week_{label}{extension}")
+                parts[label].write(swarm_section_xml(indices, row, initial, ending, change,
+                                                     comment_list if include_comments else None, width))
+        finally:
+            for writer in parts.values():
+                writer.close()
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+def _generate_in_worker(week, include_comments, out, preset, stream, split_weeks, perf_log):
+    # Each worker process collects and logs the timings of its own reports
+    perf.start_run(f"report week {week}")
+    generate_report(_worker_data, week, include_comments, out, preset, 1, stream, split_weeks)
+    if perf_log:
+        perf.write_log(perf_log)
+    return out
+
+def generate_reports(data, jobs, include_comments, preset=CHART_PRESET, workers=1, chart_workers=CHART_WORKERS,
+                     stream=False, split_weeks=False, perf_log=None):
+    """Write a report for every (week, out) pair in jobs, using `workers` processes when more than one.
+
+    The parsed data is sent to each worker once; charts are rendered serially inside
+    workers so the pools do not nest. Workers append their stage timings to perf_log.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        for week, out in jobs:
+            generate_report(data, week, include_comments, out, preset, chart_workers, stream, split_weeks)
+            print("Conversion complete! DOCX file saved as", out)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker, initargs=(data,)) as pool:
+        futures = [pool.submit(_generate_in_worker, week, include_comments, out, preset, stream, split_weeks, perf_log)
+                   for week, out in jobs]
+        for future in futures:
+            print("Conversion complete! DOCX file saved as", future.result())
+
+
+def _run_reports(parser, args):
+    """Generate the reports asked for on the command line, or prompt for one"""
+    if args.csv is None:
+        input_file = input("Enter the CSV file path: ")
+        output_file = input("Enter the output DOCX file path: ")
+        include_comments = input("Do you wish to include comments in the report? [yes/no]: ")
+
+        data = load_report_data(input_file)
+        print(f"Available weeks: {', '.join(data['weeks'])}")
+        selected_week = input(f"Choose a week to create the report for, or enter 'all' for all weeks: ")
+
+        generate_reports(data, [(selected_week, output_file)], include_comments.lower() == 'yes', args.preset,
+                         chart_workers=args.chart_workers, perf_log=args.perf_log)
+        return
+
+    data = load_report_data(args.csv, keep_rows=not args.stream)
+    weeks = list(dict.fromkeys(args.week + (data["weeks"] if args.each_week else [])))
+    if not weeks:
+        parser.error("choose the week(s) to report on with --week or --each-week")
+    if len(weeks) > 1 and "{week}" not in args.output:
+        parser.error("--output needs a {week} placeholder when writing several reports")
+
+    jobs = [(week, args.output.replace("{week}", week)) for week in weeks]
+    generate_reports(data, jobs, args.comments, args.preset, args.jobs, args.chart_workers, args.stream, args.split_weeks,
+                     args.perf_log)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate DOCX swarm campaign reports from a swarm CSV. "
+                                                 "Run without arguments to be prompted for a single report.")
+    parser.add_argument("csv", nargs="?", help="swarm CSV file to report on")
+    parser.add_argument("-w", "--week", nargs="+", default=[],
+                        help="week(s) to write a report for; 'all' writes one report covering every week")
+    parser.add_argument("--each-week", action="store_true", help="write a report for every week in the CSV")
+    parser.add_argument("-o", "--output", default="report_week_{week}.docx",
+                        help="output DOCX path, with {week} replaced by the report's week (default: %(default)s)")
+    parser.add_argument("-c", "--comments", action="store_true", help="include each swarm's comments")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default=CHART_PRESET, help="chart quality (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="reports to generate in parallel (default: %(default)s)")
+    parser.add_argument("--chart-workers", type=int, default=CHART_WORKERS,
+                        help="processes rendering the reports' charts, started once and shared by every report; "
+                             "each pays for importing matplotlib (default: %(default)s, render in this process)")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the per-swarm sections to disk so memory stays flat for very large reports")
+    parser.add_argument("--split-weeks", action="store_true",
+                        help="with --stream, write each week's swarm sections to a separate <output>_week_<week>.docx")
+    parser.add_argument("--perf-log", metavar="FILE",
+                        help="append stage timings and counters to FILE as JSON lines")
+    parser.add_argument("--profile", metavar="FILE", help="write cProfile stats for the run to FILE")
+    args = parser.parse_args(argv)
+    if args.split_weeks and not args.stream:
+        parser.error("--split-weeks needs --stream")
+
+    perf.start_run(f"report {args.csv or 'interactive'}")
+    with perf.profiled(args.profile):
+        _run_reports(parser, args)
+    if args.perf_log:
+        perf.write_log(args.perf_log)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import json
+import threading
+import numpy as np
+import ledger
+from ledger import HEADER, ROLLUP_SUFFIX
+from metrics import METRICS, ENDING_METRICS, count_comments, parse_metrics, totals_from_sums
+
+FORMAT_VERSION = 2
+WEEK = HEADER.index("Swarm Week")
+COMMENTS = HEADER.index("Comments")
+# Bytes of the CSV read at a time when the rollup is built from scratch
+BUILD_BYTES = 4 * 1024 * 1024
+# Ledger columns summed per week, in metrics.SUM_COLUMNS order (before the swarm and comment counts)
+METRIC_COLUMNS = [HEADER.index(name) for name in METRICS + ENDING_METRICS]
+
+# filename -> rollup entry: the ledger.position it covers, the week of every row,
+# the rows of every week and the metrics.SUM_COLUMNS sums of every week, plus the
+# sizes of the rollup file's full copy and of the updates appended to it. update()
+# takes an entry out while it brings it up to date, so no other thread changes it.
+_rollups = {}
+# Guards _rollups only; never held while calling into ledger, which may wait for its write lock
+_lock = threading.Lock()
+
+
+def _week_sums(rows, weeks):
+    """metrics.SUM_COLUMNS sums of some ledger rows, per week (one week per row)"""
+    if not rows:
+        return {}
+    columns = [np.nan_to_num(parse_metrics(row[column] for row in rows)[0]) for column in METRIC_COLUMNS]
+    columns.append(np.ones(len(rows)))
+    columns.append(count_comments(row[COMMENTS] for row in rows).astype(float))
+    labels, inverse = np.unique(np.array(weeks), return_inverse=True)
+    sums = np.zeros((len(labels), len(columns)))
+    np.add.at(sums, inverse.ravel(), np.column_stack(columns))
+    return dict(zip(labels.tolist(), sums.tolist()))
+
+
+def _entry(generation, csv_size, journal_size, row_weeks, weeks):
+    week_rows = {}
+    for row_number, week in enumerate(row_weeks):
+        week_rows.setdefault(week, set()).add(row_number)
+    return {"generation": generation, "csv_size": csv_size, "journal_size": journal_size,
+            "row_weeks": row_weeks, "week_rows": week_rows, "weeks": weeks, "base_size": 0, "log_size": 0}
+
+
+def _place(entry, row_number, week):
+    """Record the week of a row, appended (row_number one past the last row) or edited"""
+    row_weeks = entry["row_weeks"]
+    week_rows = entry["week_rows"]
+    if row_number == len(row_weeks):
+        row_weeks.append(week)
+    else:
+        old_rows = week_rows[row_weeks[row_number]]
+        old_rows.discard(row_number)
+        if not old_rows:
+            del week_rows[row_weeks[row_number]]
+        row_weeks[row_number] = week
+    week_rows.setdefault(week, set()).add(row_number)
+
+
+def _load(filename):
+    """Replay the rollup file: a full copy on the first line, then the updates appended since.
+
+    Only updates that carry on from where the replay has got to are applied, so
+    ones appended by several processes at once, or to a file rewritten in the
+    meantime, are skipped.
+    """
+    try:
+        with open(filename + ROLLUP_SUFFIX, "rb") as f:
+            lines = f.read().split(b"\n")
+        base = json.loads(lines[0])
+        if base.get("version") != FORMAT_VERSION:
+            return None
+        entry = _entry(base["generation"], base["csv_size"], base["journal_size"], base["rows"], base["weeks"])
+    except (OSError, ValueError, KeyError, AttributeError, TypeError):
+        return None
+    entry["base_size"] = len(lines[0]) + 1
+    for line in lines[1:]:
+        if not line:
+            continue
+        try:
+            update = json.loads(line)
+        except ValueError:
+            update = None
+        if not isinstance(update, dict):
+            # Torn by a crashed writer; rewrite the file before appending again
+            entry["log_size"] = float("inf")
+            continue
+        entry["log_size"] += len(line) + 1
+        if (update.get("generation") != entry["generation"]
+                or update.get("from") != [entry["csv_size"], entry["journal_size"]]):
+            continue
+        for row_number, week in update["rows"]:
+            _place(entry, row_number, week)
+        for week, sums in update["weeks"].items():
+            if sums is None:
+                entry["weeks"].pop(week, None)
+            else:
+                entry["weeks"][week] = sums
+        entry["csv_size"], entry["journal_size"] = update["to"]
+    return entry
+
+
+def _rewrite(filename, entry):
+    """Replace the rollup file with a full copy of the entry"""
+    data = json.dumps({"version": FORMAT_VERSION, "generation": entry["generation"],
+                       "csv_size": entry["csv_size"], "journal_size": entry["journal_size"],
+                       "rows": entry["row_weeks"], "weeks": entry["weeks"]}).encode() + b"\n"
+    if ledger.write_atomically(filename + ROLLUP_SUFFIX, lambda f: f.write(data)):
+        entry["base_size"], entry["log_size"] = len(data), 0
+
+
+def _append(filename, entry, update):
+    """Append one update to the rollup file, or rewrite it once the updates outgrow the full copy"""
+    data = json.dumps(update).encode() + b"\n"
+    if entry["log_size"] + len(data) > entry["base_size"]:
+        _rewrite(filename, entry)
+        return
+    try:
+        # A single unbuffered write, so updates appended by several processes do not interleave
+        with open(filename + ROLLUP_SUFFIX, "ab", buffering=0) as f:
+            f.write(data)
+    except OSError:
+        return
+    entry["log_size"] += len(data)
+
+
+def _build(filename, generation, csv_size, journal_size):
+    """Rollup entry of the ledger at a position, read from the files themselves BUILD_BYTES at a time"""
+    overrides = {}
+    for row_number, column, value in ledger.read_edits(filename, 0, journal_size)[0]:
+        if 0 <= column < len(HEADER):
+            overrides.setdefault(row_number, {})[column] = value
+    row_weeks = []
+    weeks = {}
+    offset, window = 0, BUILD_BYTES
+    while offset < csv_size:
+        rows, end = ledger.read_rows(filename, offset, min(offset + window, csv_size))
+        if end == offset:
+            window *= 2  # A record longer than the window
+            continue
+        if offset == 0:
+            rows = rows[1:]  # The header
+        for row_number, row in enumerate(rows, start=len(row_weeks)):
+            for column, value in overrides.get(row_number, {}).items():
+                row[column] = value
+        chunk_weeks = [row[WEEK] for row in rows]
+        for week, sums in _week_sums(rows, chunk_weeks).items():
+            weeks[week] = [a + b for a, b in zip(weeks[week], sums)] if week in weeks else sums
+        row_weeks += chunk_weeks
+        offset, window = end, BUILD_BYTES
+    return _entry(generation, csv_size, journal_size, row_weeks, weeks)
+
+
+def _advance(filename, entry, csv_size, journal_size):
+    """Fold the rows and edits up to a later position into the entry; returns the update to append"""
+    rows, csv_end = ledger.read_rows(filename, entry["csv_size"], csv_size)
+    edits, journal_end = ledger.read_edits(filename, entry["journal_size"], journal_size)
+    moved = {}
+    dirty = set()
+    for row in rows:
+        row_number = len(entry["row_weeks"])
+        _place(entry, row_number, row[WEEK])
+        moved[row_number] = row[WEEK]
+        dirty.add(row[WEEK])
+    for row_number, column, value in edits:
+        if row_number < len(entry["row_weeks"]) and (column == WEEK or column == COMMENTS or column in METRIC_COLUMNS):
+            dirty.add(entry["row_weeks"][row_number])
+            if column == WEEK:
+                _place(entry, row_number, value)
+                moved[row_number] = value
+                dirty.add(value)
+
+    # Only the rows of the weeks that changed are read back
+    row_numbers = sorted(row_number for week in dirty for row_number in entry["week_rows"].get(week, ()))
+    sums = _week_sums(ledger.get_rows(filename, row_numbers), [entry["row_weeks"][n] for n in row_numbers])
+    weeks = {}
+    for week in dirty:
+        weeks[week] = sums.get(week)
+        if week in sums:
+            entry["weeks"][week] = sums[week]
+        else:
+            entry["weeks"].pop(week, None)
+    update = {"generation": entry["generation"], "from": [entry["csv_size"], entry["journal_size"]],
+              "to": [csv_end, journal_end], "rows": sorted(moved.items()), "weeks": weeks}
+    entry["csv_size"], entry["journal_size"] = csv_end, journal_end
+    return update
+
+
+def update(filename):
+    """Bring the weekly rollup of filename up to date and return its entry.
+
+    Only weeks that gained rows, or whose rows had their week, metrics or comments
+    edited since the rollup was last brought up to date, are recomputed, from just
+    their rows, and only that change is appended to the rollup file. A rollup of
+    another generation of the ledger (see ledger.position) is rebuilt from scratch.
+    Readers never take the ledger's write lock.
+    """
+    while True:
+        generation, csv_size, journal_size = ledger.position(filename)
+        with _lock:
+            entry = _rollups.pop(filename, None)
+        if entry is None:
+            entry = _load(filename)
+        if (entry is None or entry["generation"] != generation
+                or entry["csv_size"] > csv_size or entry["journal_size"] > journal_size):
+            entry = _build(filename, generation, csv_size, journal_size)
+            _rewrite(filename, entry)
+        elif (entry["csv_size"], entry["journal_size"]) != (csv_size, journal_size):
+            try:
+                update = _advance(filename, entry, csv_size, journal_size)
+            except IndexError:
+                update = None  # Row numbers the ledger no longer has: it was rewritten meanwhile
+            if update is None or ledger.position(filename)[0] != generation:
+                continue
+            _append(filename, entry, update)
+        with _lock:
+            # Keep whichever of this entry and one another thread put back meanwhile is further on
+            other = _rollups.get(filename)
+            if (other is None or other["generation"] != entry["generation"]
+                    or (other["csv_size"], other["journal_size"]) < (entry["csv_size"], entry["journal_size"])):
+                _rollups[filename] = entry
+        return entry
+
+
+def rebase(filename, before, after):
+    """Carry an up-to-date rollup over a compaction from ledger.position before to after.
+
+    Compaction keeps every row's number and current values, so only the covered
+    position changes; a rollup at any other position is left to be rebuilt.
+    """
+    with _lock:
+        entry = _rollups.get(filename)
+        if entry is None or (entry["generation"], entry["csv_size"], entry["journal_size"]) != tuple(before):
+            return
+        entry["generation"], entry["csv_size"], entry["journal_size"] = after
+        _rewrite(filename, entry)
+
+
+def _natural_key(week):
+    return (0, int(week), "") if week.strip().lstrip("-").isdigit() else (1, 0, week)
+
+
+def weekly_totals(filename, natural_order=False, include_blank=True):
+    """Per-week and overall figures of the ledger, as metrics.aggregate returns them, from the rollup.
+
+    Weeks are sorted as text unless natural_order is set, which puts numeric weeks
+    in numeric order; include_blank=False leaves out swarms without a week.
+    """
+    weeks_sums = dict(update(filename)["weeks"])  # A copy, as another update may change it
+    weeks = sorted((week for week in weeks_sums if include_blank or week.strip()),
+                   key=_natural_key if natural_order else None)
+    return totals_from_sums(weeks, [weeks_sums[week] for week in weeks])
@@ -0,0 +1,179 @@
+import itertools
+import numpy as np
+import ledger
+from ledger import HEADER, SNAPSHOT_SUFFIX
+from metrics import METRICS, ENDING_METRICS, parse_metrics
+
+try:
+    import pyarrow as pa
+except ImportError:  # Without pyarrow every reader parses the CSV instead
+    pa = None
+
+FORMAT_VERSION = 2
+METRIC_COLUMNS = METRICS + ENDING_METRICS
+WEEK_COLUMN = "Swarm Week"
+
+# Rows appended or edits journalled since the snapshot was written are folded in on
+# load; the snapshot is rewritten once there are this many, or a quarter of the
+# ledger if that is larger.
+REWRITE_THRESHOLD = 1000
+# Rows converted and written at a time when the snapshot is built, so building it
+# takes as little memory as streaming a report
+BUILD_CHUNK_ROWS = 5000
+
+
+def _column(name, values):
+    """Typed Arrow column for ledger cells: floats for metrics, strings (blank as null) otherwise"""
+    if name in METRIC_COLUMNS:
+        numbers, valid = parse_metrics(values)
+        return pa.array(numbers, mask=~valid)
+    return pa.array([value if value else None for value in values], type=pa.string())
+
+
+def _table(rows):
+    columns = list(zip(*rows)) if rows else [()] * len(HEADER)
+    return pa.table([_column(name, column) for name, column in zip(HEADER, columns)], names=HEADER)
+
+
+def _apply_edits(table, edits):
+    """Table with journalled (row number, column, value) edits applied, later edits winning"""
+    changes = {}
+    for row_number, column, value in edits:
+        if row_number < table.num_rows and 0 <= column < len(HEADER):
+            changes.setdefault(column, {})[row_number] = value
+    for column, values in changes.items():
+        name = HEADER[column]
+        if name in METRIC_COLUMNS:
+            numbers = table.column(column).to_numpy().copy()
+            numbers[list(values)] = parse_metrics(values.values())[0]
+            array = pa.array(numbers, mask=np.isnan(numbers))
+        else:
+            cells = table.column(column).to_pylist()
+            for row_number, value in values.items():
+                cells[row_number] = value
+            array = _column(name, cells)
+        table = table.set_column(column, name, array)
+    return table
+
+
+def _encode_weeks(table, weeks):
+    """table with its week column dictionary-encoded against weeks (week -> index), which it extends.
+
+    Batches encoded in turn against the same dict only ever add to the dictionary,
+    which the IPC file format allows as dictionary deltas.
+    """
+    indices = [None if week is None else weeks.setdefault(week, len(weeks))
+               for week in table.column(WEEK_COLUMN).to_pylist()]
+    column = pa.DictionaryArray.from_arrays(pa.array(indices, type=pa.int32()), pa.array(list(weeks), type=pa.string()))
+    return table.set_column(HEADER.index(WEEK_COLUMN), WEEK_COLUMN, column)
+
+
+def write(filename, tables, generation, csv_size, journal_size, still_current=None):
+    """Atomically write tables, in order, as the snapshot of filename at the given ledger.position.
+
+    tables may be a generator, so a snapshot is written without holding all of it
+    in memory. When still_current is given, the snapshot is only put in place if it
+    returns True once everything is written. Returns whether it was.
+    """
+    metadata = {
+        "version": str(FORMAT_VERSION),
+        "generation": generation,
+        "csv_size": str(csv_size),
+        "journal_size": str(journal_size),
+    }
+    # The week repeats across every swarm of a week, so it is stored dictionary-encoded
+    schema = _table([]).schema
+    schema = schema.set(HEADER.index(WEEK_COLUMN), pa.field(WEEK_COLUMN, pa.dictionary(pa.int32(), pa.string())))
+    schema = schema.with_metadata(metadata)
+    options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    weeks = {}
+
+    def write_tables(sink):
+        with pa.ipc.new_file(sink, schema, options=options) as writer:
+            for table in tables:
+                for batch in _encode_weeks(table, weeks).combine_chunks().to_batches():
+                    writer.write_batch(pa.record_batch(batch.columns, schema=schema))
+        return still_current is None or still_current()
+
+    return ledger.write_atomically(filename + SNAPSHOT_SUFFIX, write_tables)
+
+
+def _read(filename):
+    """Memory-map the snapshot; returns (table, metadata) or None when it is missing or unreadable"""
+    try:
+        source = pa.memory_map(filename + SNAPSHOT_SUFFIX, "r")
+        table = pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+    if metadata.get("version") != str(FORMAT_VERSION) or table.column_names != HEADER:
+        return None
+    weeks = table.column(WEEK_COLUMN).cast(pa.string())
+    return table.set_column(HEADER.index(WEEK_COLUMN), WEEK_COLUMN, weeks), metadata
+
+
+def _chunks(rows):
+    while True:
+        chunk = list(itertools.islice(rows, BUILD_CHUNK_ROWS))
+        if not chunk:
+            return
+        yield _table(chunk)
+
+
+def build(filename):
+    """Write a snapshot of the whole ledger, BUILD_CHUNK_ROWS rows at a time, and memory-map it.
+
+    Returns (table, CSV size, journal size), or None when the snapshot cannot be
+    written or another process kept writing to the ledger while it was read.
+    """
+    for _ in range(3):
+        before = ledger.position(filename)
+        if not write(filename, _chunks(ledger.iter_rows(filename)), *before,
+                     still_current=lambda: ledger.position(filename) == before):
+            if ledger.position(filename) == before:
+                return None  # Unwritable rather than written to meanwhile
+            continue
+        snapshot = _read(filename)
+        if snapshot is None or snapshot[1].get("generation") != before[0]:
+            return None
+        return snapshot[0], int(snapshot[1]["csv_size"]), int(snapshot[1]["journal_size"])
+    return None
+
+
+def load(filename):
+    """The current ledger as (Arrow table, CSV size, journal size), or None to parse the CSV instead.
+
+    The memory-mapped snapshot is used as long as the ledger's generation is the one
+    it was written for, i.e. the files were only appended to since; the rows and
+    edits appended since then are folded in. A missing or stale snapshot is rebuilt
+    from the CSV. None is returned without pyarrow or when the ledger is being
+    written too fast to read consistently.
+    """
+    if pa is None:
+        return None
+    generation, csv_size, journal_size = ledger.position(filename)
+    snapshot = _read(filename)
+    if snapshot is not None:
+        table, metadata = snapshot
+        covered_csv, covered_journal = int(metadata["csv_size"]), int(metadata["journal_size"])
+        if (metadata.get("generation") == generation and covered_csv <= csv_size
+                and covered_journal <= journal_size):
+            if (covered_csv, covered_journal) == (csv_size, journal_size):
+                return table, csv_size, journal_size
+            edits, _ = ledger.read_edits(filename, covered_journal, journal_size)
+            rows, _ = ledger.read_rows(filename, covered_csv, csv_size)
+            if rows:
+                table = pa.concat_tables([table, _table(rows)])
+            table = _apply_edits(table, edits)
+            if len(rows) + len(edits) >= max(REWRITE_THRESHOLD, table.num_rows // 4):
+                batches = table.to_batches(max_chunksize=BUILD_CHUNK_ROWS)
+                write(filename, (pa.Table.from_batches([batch]) for batch in batches),
+                      generation, csv_size, journal_size)
+            return table, csv_size, journal_size
+    return build(filename)
+
+
+def refresh(filename):
+    """Rewrite the snapshot of filename from the ledger, e.g. after the CSV was rewritten"""
+    if pa is not None:
+        build(filename)
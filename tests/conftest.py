@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+from contextlib import contextmanager
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ledger  # noqa: E402
+
+# Generous, since it only bounds how long a test that would otherwise hang takes to fail
+TIMEOUT = 30
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "ledger(weeks=1, swarms=10): size of the ledger_file fixture's ledger")
+
+
+@pytest.fixture
+def swarm():
+    """Factory of add_swarm dicts: blank apart from the week, number, 100 views and one comment"""
+    def make(week, number, **fields):
+        data = {field: "" for field in ledger.SWARM_FIELDS}
+        data.update(sw_week=str(week), sw_number=str(number), views="100", comments="First")
+        data.update(fields)
+        return data
+    return make
+
+
+@pytest.fixture
+def ledger_file(request, tmp_path, swarm):
+    """A new ledger with `swarms` swarms (SW-<week>-1, ...) in each of weeks 1 to `weeks`, as set by a ledger marker"""
+    marker = request.node.get_closest_marker("ledger")
+    size = {"weeks": 1, "swarms": 10, **(marker.kwargs if marker else {})}
+    filename = str(tmp_path / "swarms.csv")
+    ledger.create_csv(filename)
+    ledger.add_swarms(filename, [swarm(week, number) for week in range(1, size["weeks"] + 1)
+                                 for number in range(1, size["swarms"] + 1)])
+    return filename
+
+
+@pytest.fixture
+def hold_write_lock():
+    """Context manager factory: another thread holds the ledger's write lock until the block ends"""
+    @contextmanager
+    def hold(filename):
+        held, release = threading.Event(), threading.Event()
+
+        def run():
+            with ledger.locked(filename):
+                held.set()
+                release.wait()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        held.wait()
+        try:
+            yield
+        finally:
+            release.set()
+            thread.join()
+    return hold
+
+
+@pytest.fixture
+def finishes():
+    """Run a function in another thread; returns its result, or raises if it is still waiting after TIMEOUT"""
+    def run(function):
+        result = {}
+
+        def target():
+            try:
+                result["value"] = function()
+            except BaseException as error:
+                result["error"] = error
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(TIMEOUT)
+        assert not thread.is_alive(), f"{function} did not finish within {TIMEOUT}s"
+        if "error" in result:
+            raise result["error"]
+        return result["value"]
+    return run
@@ -0,0 +1,192 @@
+import csv
+import os
+import subprocess
+import sys
+import threading
+import ledger
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VIEWS = ledger.HEADER.index("Views")
+COMMENTS = ledger.HEADER.index("Comments")
+
+
+def _exported(filename, tmp_path):
+    out = str(tmp_path / "export.csv")
+    ledger.export_csv(filename, out)
+    with open(out, newline='', encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def _fresh(filename):
+    """Forget the in-memory state, as a new process would start without it"""
+    ledger.forget(filename)
+
+
+def _in_other_process(code):
+    subprocess.run([sys.executable, "-c", "import ledger\n" + code], cwd=REPO, check=True)
+
+
+def test_add_edit_compact_round_trip(ledger_file, tmp_path, swarm):
+    ledger.add_swarm(ledger_file, swarm(2, 1, views="12.3k"))
+    assert ledger.edit_swarm(ledger_file, "SW-1-3", VIEWS, "950") == "Swarm SW-1-3 updated."
+    assert ledger.edit_swarm(ledger_file, "SW-1-4", 0, "SW-9-9") == "Swarm SW-1-4 updated."
+    assert ledger.edit_swarm(ledger_file, "SW-7-7", VIEWS, "1") == "Swarm ID SW-7-7 not found."
+
+    rows = _exported(ledger_file, tmp_path)
+    assert rows[0] == ledger.HEADER
+    assert len(rows) == 12
+    assert rows[3][VIEWS] == "950"
+    assert rows[4][0] == "SW-9-9"
+    assert rows[11][0] == "SW-2-1" and rows[11][VIEWS] == "12.3k"
+
+    ledger.compact(ledger_file)
+    assert not os.path.exists(ledger_file + ledger.JOURNAL_SUFFIX)
+    with open(ledger_file, newline='', encoding="utf-8") as f:
+        assert list(csv.reader(f)) == rows
+    _fresh(ledger_file)
+    assert _exported(ledger_file, tmp_path) == rows
+    assert ledger.get_swarm(ledger_file, "SW-9-9")[VIEWS] == "100"
+    assert ledger.get_swarm(ledger_file, "SW-1-4") is None
+
+
+def test_multiline_quoted_comments(ledger_file, tmp_path, swarm):
+    text = 'First line\nSecond, with "quotes"\r\nThird'
+    ledger.add_swarm(ledger_file, swarm(3, 1, comments=text))
+    ledger.add_swarm(ledger_file, swarm(3, 2))
+    ledger.edit_swarm(ledger_file, "SW-1-1", COMMENTS, "Edited\nTwice")
+
+    for _ in range(2):
+        assert ledger.get_swarm(ledger_file, "SW-3-1")[COMMENTS] == text
+        assert ledger.get_swarm(ledger_file, "SW-3-2")[0] == "SW-3-2"
+        assert ledger.comment_store(ledger_file)["total"] == 9 + 2 + 3 + 1
+        rows = _exported(ledger_file, tmp_path)
+        assert [row[COMMENTS] for row in rows[1:3]] == ["Edited\nTwice", "First"]
+        assert rows[11][COMMENTS] == text
+        # The same again when the state is loaded from the persistent index and journal
+        _fresh(ledger_file)
+
+
+def test_refresh_after_appends_by_another_process(ledger_file, swarm):
+    generation = ledger._state(ledger_file)["generation"]
+    _in_other_process(f"""
+ledger.add_swarm({ledger_file!r}, {swarm(4, 1)!r})
+ledger.edit_swarm({ledger_file!r}, "SW-1-2", {VIEWS}, "2k")
+""")
+    assert ledger.get_swarm(ledger_file, "SW-4-1")[0] == "SW-4-1"
+    assert ledger.get_swarm(ledger_file, "SW-1-2")[VIEWS] == "2k"
+    # The ledger's own appends are picked up incrementally
+    assert ledger._state(ledger_file)["generation"] == generation
+
+
+def test_refresh_after_external_append(ledger_file):
+    ledger._state(ledger_file)
+    with open(ledger_file, "a", newline='', encoding="utf-8") as f:
+        csv.writer(f).writerow(["SW-5-1", "5", "1"] + [""] * 14)
+    assert ledger.get_swarm(ledger_file, "SW-5-1")[1] == "5"
+    assert len(list(ledger.iter_rows(ledger_file))) == 11
+
+
+def test_same_size_rewrite_is_detected(ledger_file):
+    ledger.edit_swarm(ledger_file, "SW-1-2", VIEWS, "2k")
+    generation = ledger._state(ledger_file)["generation"]
+    with open(ledger_file, "r+b") as f:
+        data = f.read()
+        f.seek(0)
+        f.write(data.replace(b"SW-1-1,1,1,,,,100,", b"SW-1-1,1,1,,,,900,"))
+    assert os.path.getsize(ledger_file) == len(data)
+
+    assert ledger.get_swarm(ledger_file, "SW-1-1")[VIEWS] == "900"
+    assert ledger.get_swarm(ledger_file, "SW-1-2")[VIEWS] == "2k"
+    assert ledger._state(ledger_file)["generation"] != generation
+
+
+def test_longer_row_rewrite_is_detected(ledger_file):
+    ledger._state(ledger_file)
+    with open(ledger_file, encoding="utf-8", newline='') as f:
+        rows = list(csv.reader(f))
+    rows[3][COMMENTS] = "A much longer comment written in a spreadsheet\nover two lines"
+    with open(ledger_file, "w", encoding="utf-8", newline='') as f:
+        csv.writer(f).writerows(rows)
+
+    for _ in range(2):
+        assert len(list(ledger.iter_rows(ledger_file))) == 10
+        assert ledger.get_swarm(ledger_file, "SW-1-7")[:3] == ["SW-1-7", "1", "7"]
+        assert ledger.get_swarm(ledger_file, "SW-1-3")[COMMENTS] == rows[3][COMMENTS]
+        # A new process must not inherit a stale index either
+        _fresh(ledger_file)
+
+
+def test_compaction_by_another_process(ledger_file, swarm):
+    ledger.edit_swarm(ledger_file, "SW-1-1", VIEWS, "1k")
+    ledger._state(ledger_file)
+    _in_other_process(f"""
+ledger.edit_swarm({ledger_file!r}, "SW-1-2", {COMMENTS}, "Longer comments\\nthat move every later row")
+ledger.compact({ledger_file!r})
+ledger.add_swarm({ledger_file!r}, {swarm(6, 1)!r})
+""")
+    rows = list(ledger.iter_rows(ledger_file))
+    assert [row[0] for row in rows] == [f"SW-1-{number}" for number in range(1, 11)] + ["SW-6-1"]
+    assert ledger.get_swarm(ledger_file, "SW-1-1")[VIEWS] == "1k"
+    assert ledger.get_swarm(ledger_file, "SW-1-7")[:3] == ["SW-1-7", "1", "7"]
+    assert ledger.get_swarm(ledger_file, "SW-6-1")[1] == "6"
+
+
+def test_read_only_directory(ledger_file, tmp_path, monkeypatch):
+    ledger.edit_swarm(ledger_file, "SW-1-1", VIEWS, "1k")
+    for suffix in (ledger.INDEX_SUFFIX, ledger.STAMP_SUFFIX, ledger.LOCK_SUFFIX):
+        os.remove(ledger_file + suffix)
+    _fresh(ledger_file)
+
+    def read_only_open(path, mode="r", *args, **kwargs):
+        if any(flag in mode for flag in "wax+"):
+            raise PermissionError(13, "Permission denied", path)
+        return open(path, mode, *args, **kwargs)
+
+    # Stands in for a read-only directory, which root can write to anyway
+    monkeypatch.setattr(ledger, "open", read_only_open, raising=False)
+    assert ledger.get_swarm(ledger_file, "SW-1-1")[VIEWS] == "1k"
+    assert len(list(ledger.iter_rows(ledger_file))) == 10
+    assert ledger.comment_store(ledger_file)["total"] == 10
+    assert sorted(os.listdir(tmp_path)) == ["swarms.csv", "swarms.csv.journal"]
+
+
+def test_stray_quote_in_unquoted_field(ledger_file, tmp_path):
+    # As a spreadsheet saves a tweet mentioning a 5" screen: the field is not quoted
+    with open(ledger_file, "rb") as f:
+        data = f.read()
+    with open(ledger_file, "wb") as f:
+        f.write(data.replace(b"SW-1-1,1,1,,,,100,", b'SW-1-1,1,1,u,5" screen,,100,'))
+
+    for _ in range(2):
+        rows = list(ledger.iter_rows(ledger_file))
+        assert len(rows) == 10
+        assert rows[0][4] == '5" screen' and rows[0][VIEWS] == "100"
+        assert ledger.get_swarm(ledger_file, "SW-1-2")[:3] == ["SW-1-2", "1", "2"]
+        _fresh(ledger_file)
+
+    ledger.edit_swarm(ledger_file, "SW-1-1", VIEWS, "1k")
+    ledger.compact(ledger_file)
+    rows = _exported(ledger_file, tmp_path)
+    assert len(rows) == 11 and rows[1][4] == '5" screen' and rows[1][VIEWS] == "1k"
+
+
+def test_write_atomically(tmp_path):
+    path = str(tmp_path / "sidecar")
+    payloads = [bytes([number]) * 200_000 for number in range(8)]
+    threads = [threading.Thread(target=ledger.write_atomically, args=(path, lambda f, data=data: f.write(data)))
+               for data in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(path, "rb") as f:
+        assert f.read() in payloads
+    assert os.listdir(tmp_path) == ["sidecar"]
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~ledger._umask
+
+    assert not ledger.write_atomically(path, lambda f: f.write(b"partial") and False)
+    assert ledger.write_atomically(path, lambda f: f.write("text"), text=True)
+    with open(path, "rb") as f:
+        assert f.read() == b"text"
+    assert not ledger.write_atomically(str(tmp_path / "missing" / "sidecar"), lambda f: f.write(b""))
+    assert os.listdir(tmp_path) == ["sidecar"]
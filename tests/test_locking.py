@@ -0,0 +1,49 @@
+import threading
+import time
+import pytest
+import ledger
+
+pytestmark = pytest.mark.ledger(swarms=20)
+
+
+def test_concurrent_edits_are_group_committed(ledger_file, monkeypatch):
+    batches = []
+    write_edits = ledger._write_edits
+
+    def slow_write_edits(filename, requests):
+        if not batches:
+            # Hold the first writer until every other edit is queued behind it
+            deadline = time.monotonic() + 30
+            while len(ledger._pending_edits.get(filename, [])) < 20 - len(requests) and time.monotonic() < deadline:
+                time.sleep(0.01)
+        batches.append(len(requests))
+        write_edits(filename, requests)
+
+    monkeypatch.setattr(ledger, "_write_edits", slow_write_edits)
+    results = []
+    threads = [threading.Thread(target=lambda number=number: results.append(
+        ledger.edit_swarm(ledger_file, f"SW-1-{number}", 6, f"{number}k"))) for number in range(1, 21)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(batches) == 20
+    assert len(batches) == 2
+    assert sorted(results) == sorted(f"Swarm SW-1-{number} updated." for number in range(1, 21))
+    ledger._states.clear()
+    assert [row[6] for row in ledger.iter_rows(ledger_file)] == [f"{number}k" for number in range(1, 21)]
+
+
+def test_locks_are_per_ledger(ledger_file, tmp_path, swarm, hold_write_lock, finishes):
+    other = str(tmp_path / "other.csv")
+    ledger.create_csv(other)
+    with hold_write_lock(ledger_file):
+        finishes(lambda: ledger.add_swarm(other, swarm(2, 1)))
+        assert ledger.get_swarm(other, "SW-2-1") is not None
+
+
+def test_reads_do_not_wait_for_writers(ledger_file, hold_write_lock, finishes):
+    with hold_write_lock(ledger_file):
+        assert finishes(lambda: ledger.get_swarm(ledger_file, "SW-1-5"))[6] == "100"
+        assert len(finishes(lambda: ledger.comment_store(ledger_file))["rows"]) == 20
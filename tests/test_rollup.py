@@ -0,0 +1,121 @@
+import json
+import threading
+import pytest
+import ledger
+import rollup
+
+VIEWS = ledger.HEADER.index("Views")
+COMMENTS = ledger.HEADER.index("Comments")
+
+pytestmark = pytest.mark.ledger(weeks=3, swarms=50)
+
+
+def _expected(filename):
+    """Per-week sums recomputed from every current row"""
+    rows = list(ledger.iter_rows(filename))
+    return rollup._week_sums(rows, [row[rollup.WEEK] for row in rows])
+
+
+def _rollup_lines(filename):
+    with open(filename + ledger.ROLLUP_SUFFIX, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_appends_and_edits_are_folded_in(ledger_file, swarm):
+    rollup.update(ledger_file)
+    ledger.add_swarms(ledger_file, [swarm(3, 51, views="1.5k"), swarm(4, 1, comments="A\nB")])
+    ledger.edit_swarm(ledger_file, "SW-1-2", VIEWS, "2k")
+    ledger.edit_swarm(ledger_file, "SW-1-3", COMMENTS, "One\nTwo\nThree")
+    ledger.edit_swarm(ledger_file, "SW-2-4", 1, "4")
+    assert rollup.update(ledger_file)["weeks"] == _expected(ledger_file)
+
+    # Only the change was appended to the full copy, and a new process replays it
+    lines = _rollup_lines(ledger_file)
+    assert len(lines) == 2 and len(lines[0]["rows"]) == 150
+    assert sorted(lines[1]["weeks"]) == ["1", "2", "3", "4"]
+    rollup._rollups.clear()
+    entry = rollup.update(ledger_file)
+    assert entry["weeks"] == _expected(ledger_file)
+    assert entry["week_rows"]["4"] == {50 + 3, 150 + 1}
+    assert (entry["generation"], entry["csv_size"], entry["journal_size"]) == ledger.position(ledger_file)
+
+
+def test_build_reads_a_window_at_a_time(ledger_file, monkeypatch, swarm):
+    monkeypatch.setattr(rollup, "BUILD_BYTES", 100)
+    ledger.add_swarm(ledger_file, swarm(2, 51, comments="A long comment\n" * 20))
+    ledger.edit_swarm(ledger_file, "SW-3-7", 1, "2")
+    ledger.edit_swarm(ledger_file, "SW-1-1", VIEWS, "3k")
+    position = ledger.position(ledger_file)
+    entry = rollup._build(ledger_file, *position)
+    assert entry["weeks"] == _expected(ledger_file)
+    assert len(entry["row_weeks"]) == 151 and entry["row_weeks"][100 + 6] == "2"
+
+
+def test_torn_and_stray_updates_are_skipped(ledger_file, swarm):
+    ledger.add_swarm(ledger_file, swarm(5, 1))
+    rollup.update(ledger_file)
+    with open(ledger_file + ledger.ROLLUP_SUFFIX, "a", encoding="utf-8") as f:
+        # One from another generation of the ledger, then one cut short by a crash
+        f.write(json.dumps({"generation": "0", "from": [0, 0], "to": [0, 0], "rows": [], "weeks": {}}) + "\n")
+        f.write('{"generation": ')
+    ledger.edit_swarm(ledger_file, "SW-5-1", VIEWS, "9")
+    rollup._rollups.clear()
+    assert rollup.update(ledger_file)["weeks"] == _expected(ledger_file)
+    rollup._rollups.clear()
+    assert rollup.update(ledger_file)["weeks"] == _expected(ledger_file)
+
+
+def test_external_rewrite_rebuilds(ledger_file):
+    rollup.update(ledger_file)
+    with open(ledger_file, "r+b") as f:
+        data = f.read()
+        f.seek(0)
+        f.write(data.replace(b"SW-1-1,1,1,,,,100,", b"SW-1-1,1,1,,,,900,"))
+    assert rollup.update(ledger_file)["weeks"]["1"][0] == 50 * 100 + 800
+    assert rollup.update(ledger_file)["weeks"] == _expected(ledger_file)
+
+
+def test_compaction_rebases(ledger_file, swarm):
+    ledger.edit_swarm(ledger_file, "SW-1-1", COMMENTS, "Longer\ncomment")
+    ledger.edit_swarm(ledger_file, "SW-3-1", 1, "1")
+    weeks = rollup.update(ledger_file)["weeks"]
+    ledger.compact(ledger_file)
+
+    base = _rollup_lines(ledger_file)[0]
+    assert base["generation"] == ledger.position(ledger_file)[0]
+    assert base["weeks"] == weeks == _expected(ledger_file)
+    ledger.add_swarm(ledger_file, swarm(1, 51))
+    rollup._rollups.clear()
+    assert rollup.update(ledger_file)["weeks"] == _expected(ledger_file)
+
+
+def test_reads_do_not_take_the_write_lock(ledger_file, swarm, hold_write_lock, finishes):
+    ledger.add_swarm(ledger_file, swarm(6, 1))
+    with hold_write_lock(ledger_file):
+        assert finishes(lambda: rollup.weekly_totals(ledger_file))["weeks"] == ["1", "2", "3", "6"]
+
+
+@pytest.mark.ledger(swarms=4)  # Small enough that every edit compacts the ledger
+def test_compaction_during_rollup_update_does_not_deadlock(ledger_file, monkeypatch):
+    monkeypatch.setattr(ledger, "COMPACT_THRESHOLD", 1)
+    done = threading.Event()
+
+    def edit():
+        for number in range(1, 31):
+            ledger.edit_swarm(ledger_file, f"SW-1-{number % 4 + 1}", VIEWS, f"{number}k")
+            # A row added in a spreadsheet sends readers down the rebuild path, which takes the write lock
+            with open(ledger_file, "a", encoding="utf-8", newline='') as f:
+                f.write(f"SW-7-{number},7,{number}\r\n")
+        done.set()
+
+    def read():
+        while not done.is_set():
+            rollup.update(ledger_file)
+
+    threads = [threading.Thread(target=edit, daemon=True), threading.Thread(target=read, daemon=True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    assert not any(thread.is_alive() for thread in threads)
+    assert rollup.update(ledger_file)["weeks"] == _expected(ledger_file)
@@ -0,0 +1,59 @@
+import pytest
+import ledger
+
+pa = pytest.importorskip("pyarrow")
+import snapshot
+
+VIEWS = ledger.HEADER.index("Views")
+
+pytestmark = pytest.mark.ledger(swarms=200)
+
+
+def _expected(filename):
+    """The table a fresh snapshot of the ledger as it is now would hold"""
+    return snapshot._table(list(ledger.iter_rows(filename)))
+
+
+def test_appends_and_edits_are_folded_in(ledger_file, swarm):
+    snapshot.refresh(ledger_file)
+    ledger.add_swarm(ledger_file, swarm(2, 1, comments="Multi\nline"))
+    ledger.edit_swarm(ledger_file, "SW-1-5", VIEWS, "2k")
+    ledger.edit_swarm(ledger_file, "SW-1-6", 0, "SW-3-3")
+
+    table, csv_size, journal_size = snapshot.load(ledger_file)
+    assert table.equals(_expected(ledger_file))
+    assert ledger.position(ledger_file)[1:] == (csv_size, journal_size)
+
+
+def test_same_size_rewrite_invalidates_snapshot(ledger_file):
+    snapshot.refresh(ledger_file)
+    with open(ledger_file, "r+b") as f:
+        data = f.read()
+        f.seek(0)
+        f.write(data.replace(b"SW-1-1,1,1,,,,100,", b"SW-1-1,1,1,,,,900,"))
+
+    table = snapshot.load(ledger_file)[0]
+    assert table.column("Views").to_pylist()[0] == 900
+    assert table.equals(_expected(ledger_file))
+
+
+def test_dataset_sees_same_size_rewrite(ledger_file, swarm):
+    pytest.importorskip("pandas")
+    import dataset
+
+    assert dataset.load_data(ledger_file)["Views"].sum() == 20000
+    with open(ledger_file, "r+b") as f:
+        data = f.read()
+        f.seek(0)
+        f.write(data.replace(b"SW-1-1,1,1,,,,100,", b"SW-1-1,1,1,,,,900,"))
+    ledger.add_swarm(ledger_file, swarm(2, 1))
+    assert dataset.load_data(ledger_file)["Views"].sum() == 20900
+
+
+def test_build_writes_in_chunks(ledger_file, monkeypatch, swarm):
+    monkeypatch.setattr(snapshot, "BUILD_CHUNK_ROWS", 7)
+    ledger.add_swarms(ledger_file, [swarm(week, 1) for week in range(2, 9)])
+    table = snapshot.build(ledger_file)[0]
+    assert table.equals(_expected(ledger_file))
+    with pa.memory_map(ledger_file + ledger.SNAPSHOT_SUFFIX) as source:
+        assert pa.ipc.open_file(source).num_record_batches == 30